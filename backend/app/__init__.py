@@ -4,14 +4,25 @@ Main application package.
 import os
 from flask import Flask
 from flask_cors import CORS
-from app.utils.db import close_mongo_connection
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app.utils.db import close_mongo_connection, get_mongo_health
+from app.utils.passwords import password_hasher
+from app.storage import init_storage, init_content_caches
+from app.utils.indexes import ensure_indexes
+from app.cli import register_commands
+from app.scheduler import init_scheduler
+from app.utils.ratelimit import init_rate_limiter
+from app.utils.json_provider import FastJSONProvider
+from app.utils.metrics import init_metrics
+from app.utils.http import RESUME_TOKEN_HEADER
+from app.utils.profiler import init_profiler
 
 def create_app(test_config=None):
     """Create and configure the Flask application"""
     app = Flask(__name__, instance_relative_config=True)
     
-    # Enable CORS
-    CORS(app)
+    # Enable CORS, letting the frontend read download resume tokens
+    CORS(app, expose_headers=[RESUME_TOKEN_HEADER])
     
     # Load default configuration
     app.config.from_mapping(
@@ -19,6 +30,46 @@ def create_app(test_config=None):
         MONGO_URI=os.environ.get('MONGO_URI', 'mongodb://mongo:27017/'),
         DB_NAME=os.environ.get('DB_NAME', 'secure_share'),
         MAX_CONTENT_LENGTH=100 * 1024 * 1024,  # 100MB max file size
+        STORAGE_BACKEND=os.environ.get('STORAGE_BACKEND', 'gridfs'),  # 'gridfs' or 'local'
+        LOCAL_STORAGE_PATH=os.environ.get('LOCAL_STORAGE_PATH'),  # Defaults to <instance>/storage
+        HOT_FILE_CACHE_BYTES=int(os.environ.get('HOT_FILE_CACHE_BYTES', 64 * 1024 * 1024)),  # Memory cache per process, 0 disables it
+        HOT_FILE_MAX_SIZE=int(os.environ.get('HOT_FILE_MAX_SIZE', 1024 * 1024)),  # Largest file kept in memory
+        HOT_FILE_MIN_HITS=int(os.environ.get('HOT_FILE_MIN_HITS', 3)),  # Downloads of a file before it is kept in memory
+        DISK_CACHE_PATH=os.environ.get('DISK_CACHE_PATH'),  # Disk cache of large remote files, unset disables it
+        DISK_CACHE_MAX_BYTES=int(os.environ.get('DISK_CACHE_MAX_BYTES', 10 * 1024 * 1024 * 1024)),
+        RECLAIM_BATCH_SIZE=100,  # Records or storage entries per reclaim batch
+        RECLAIM_MAX_BATCHES=10,  # Batches per reclaim step and run
+        RECLAIM_DELETES_PER_SECOND=20,  # Pace of storage deletes, 0 for unlimited
+        ORPHAN_GRACE_HOURS=24,  # Age before unreferenced content counts as orphaned
+        SCHEDULER_ENABLED=os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true',  # Run maintenance jobs in-process
+        RECLAIM_INTERVAL_MINUTES=15,
+        UPLOAD_SESSION_PURGE_INTERVAL_MINUTES=60,
+        TRUSTED_PROXIES=int(os.environ.get('TRUSTED_PROXIES', '0')),  # Reverse proxies (e.g. nginx) in front of the app
+        ENSURE_INDEXES=os.environ.get('ENSURE_INDEXES', 'true').lower() == 'true',  # Create indexes on startup
+        FAST_JSON=os.environ.get('FAST_JSON', 'true').lower() == 'true',  # Encode responses with orjson if installed
+        METRICS_ENABLED=os.environ.get('METRICS_ENABLED', 'true').lower() == 'true',  # Serve /metrics
+        METRICS_DIR=os.environ.get('METRICS_DIR'),  # Per-process snapshots, defaults to <instance>/metrics
+        METRICS_TOKEN=os.environ.get('METRICS_TOKEN'),  # Bearer token of the Prometheus scraper
+        METRICS_ALLOWED_IPS=os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1'),  # Scrapers allowed without the token
+        PROFILER_ENABLED=os.environ.get('PROFILER_ENABLED', 'true').lower() == 'true',  # Honour the admin X-Profile header
+        PROFILE_SAMPLE_RATE=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),  # Fraction of requests profiled at random
+        PROFILE_MODE=os.environ.get('PROFILE_MODE', 'cprofile'),  # 'cprofile' (pstats) or 'sampling' (collapsed stacks)
+        PROFILE_SAMPLING_INTERVAL=0.005,  # Seconds between stack samples
+        PROFILE_DIR=os.environ.get('PROFILE_DIR'),  # Defaults to <instance>/profiles
+        PROFILE_KEEP=int(os.environ.get('PROFILE_KEEP', '200')),  # Older profiles are deleted
+        RATE_LIMIT_ENABLED=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+        RATE_LIMIT_STORAGE=os.environ.get('RATE_LIMIT_STORAGE', 'memory'),  # 'memory' (per node) or 'mongo' (cluster wide)
+        RATE_LIMIT_PATH=os.environ.get('RATE_LIMIT_PATH'),  # Shared bucket file, defaults to <instance>/ratelimit.bin
+        RATE_LIMIT_SLOTS=65536,  # Buckets in the shared file
+        # Requests allowed per period (seconds) by endpoint, keyed by 'ip', 'user' or 'token'
+        RATE_LIMITS={
+            'auth.login': {'limit': 10, 'period': 60, 'key': 'ip'},
+            'auth.register': {'limit': 5, 'period': 300, 'key': 'ip'},
+            'auth.change_password': {'limit': 5, 'period': 300, 'key': 'user'},
+            'files.get_shared_file_info': {'limit': 60, 'period': 60, 'key': 'ip'},
+            'files.download_shared_file': {'limit': 30, 'period': 60, 'key': 'ip'},
+            'files.download_file': {'limit': 30, 'period': 60, 'key': 'ip'},
+        },
     )
 
     if test_config is None:
@@ -28,25 +79,62 @@ def create_app(test_config=None):
         # Load the test config if passed in
         app.config.from_mapping(test_config)
 
+    app.json = FastJSONProvider(app, use_orjson=app.config['FAST_JSON'])
+
+    # Take the client address from X-Forwarded-For behind trusted proxies,
+    # rate limits and /metrics access depend on it
+    if app.config['TRUSTED_PROXIES']:
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
     # Ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
 
+    # Set up file content storage and its memory and disk caches
+    init_storage(app)
+    init_content_caches(app)
+
+    # Create missing MongoDB indexes (also available as `flask ensure-indexes`)
+    if app.config['ENSURE_INDEXES']:
+        try:
+            ensure_indexes()
+        except Exception as e:
+            print(f"Could not ensure MongoDB indexes: {e}")
+
+    register_commands(app)
+
+    # Request timing and the Prometheus /metrics endpoint
+    init_metrics(app)
+
+    # Throttle login attempts and link scraping
+    init_rate_limiter(app)
+
+    # Profile requests on demand (X-Profile header) or at PROFILE_SAMPLE_RATE
+    init_profiler(app)
+
+    # Periodic maintenance (expiry reclamation, abandoned uploads)
+    init_scheduler(app)
+
     # Register teardown callback to close MongoDB connection only on app shutdown
     import atexit
     atexit.register(close_mongo_connection)
+    atexit.register(password_hasher.shutdown)
 
     # A simple route to verify the app is working
     @app.route('/health')
     def health_check():
-        return {'status': 'ok'}
+        database = get_mongo_health()
+        status = 'ok' if database['writable'] else 'degraded'
+        return {'status': status, 'database': database}, 200 if database['writable'] else 503
 
     # Import and register blueprints
-    from app.routes import auth_bp, user_bp, file_bp
+    from app.routes import auth_bp, user_bp, file_bp, admin_bp
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(user_bp, url_prefix='/api/users')
     app.register_blueprint(file_bp, url_prefix='/api/files')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
 
     return app
@@ -0,0 +1,20 @@
+"""
+ASGI application factory for serving with an async server.
+
+Every request goes through the regular Flask application, wrapped by
+a2wsgi's WSGI adapter, so routes, services, rate limits, metrics, CORS
+and error handling are the same as under gunicorn. Requests are handled
+on a pool of ASGI_THREADS threads per process, with request bodies
+streamed to the application as they arrive.
+"""
+import os
+from a2wsgi import WSGIMiddleware
+from app import create_app
+
+# Threads running Flask request handlers, per process
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+
+def create_asgi_app(test_config=None):
+    """Create the ASGI application wrapping a regular Flask application"""
+    return WSGIMiddleware(create_app(test_config), workers=ASGI_THREADS)
@@ -0,0 +1,40 @@
+"""
+Command line tools registered on the Flask CLI.
+
+Run them with `flask --app main <command>` from the backend directory.
+"""
+import click
+from app.utils.indexes import ensure_indexes, get_index_builds, get_index_usage
+
+
+def register_commands(app):
+    """Register maintenance commands on the application"""
+
+    @app.cli.command('ensure-indexes')
+    def ensure_indexes_command():
+        """Create all registered MongoDB indexes."""
+        for collection_name, result in ensure_indexes().items():
+            click.echo(f"{collection_name}: {result}")
+
+        for build in get_index_builds():
+            click.echo(f"building {build['collection']} {', '.join(build['indexes'])}: {build['progress']}")
+
+    @app.cli.command('index-report')
+    def index_report_command():
+        """Show running index builds and unused or unregistered indexes."""
+        builds = get_index_builds()
+        click.echo(f"Index builds in progress: {len(builds)}")
+        for build in builds:
+            click.echo(f"  {build['collection']} {', '.join(build['indexes'])}: {build['progress']}")
+
+        click.echo("Index usage:")
+        for index in get_index_usage():
+            flags = []
+            if index['ops'] == 0 and index['index'] != '_id_':
+                flags.append('UNUSED')
+            if not index['registered']:
+                flags.append('UNREGISTERED')
+            click.echo(
+                f"  {index['collection']}.{index['index']}: {index['ops']} ops since "
+                f"{index['since']:%Y-%m-%d %H:%M} {' '.join(flags)}".rstrip()
+            )
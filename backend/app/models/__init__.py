@@ -3,5 +3,8 @@ Models package initialization.
 """
 from .user import User
 from .file import File
+from .blob import Blob
+from .upload_session import UploadSession
+from .revoked_token import RevokedToken
 
-__all__ = ['User', 'File']
+__all__ = ['User', 'File', 'Blob', 'UploadSession', 'RevokedToken']
@@ -0,0 +1,106 @@
+"""
+Blob model for content-addressed file storage.
+"""
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.utils.db import get_db
+
+
+class Blob:
+    """
+    A unique piece of file content stored once in a storage backend
+
+    Blobs are keyed by the SHA-256 digest of their content and carry a
+    reference count of the file records pointing at them.
+    """
+
+    @staticmethod
+    def get_blob(checksum):
+        """Get blob by content checksum"""
+        db = get_db()
+        return db.blobs.find_one({'_id': checksum})
+
+    @staticmethod
+    def create_blob(checksum, storage_backend, storage_ref, file_size, file_type):
+        """
+        Register newly stored content with a single reference
+
+        Returns:
+            bool: False if a blob with the same checksum already exists
+        """
+        db = get_db()
+        try:
+            db.blobs.insert_one({
+                '_id': checksum,
+                'storage_backend': storage_backend,
+                'storage_ref': storage_ref,
+                'file_size': file_size,
+                'file_type': file_type,
+                'ref_count': 1,
+                'created_at': datetime.utcnow()
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    @staticmethod
+    def add_reference(checksum):
+        """
+        Add a reference to existing content
+
+        Returns:
+            dict: Updated blob document or None if the content is not stored
+        """
+        db = get_db()
+        return db.blobs.find_one_and_update(
+            {'_id': checksum},
+            {'$inc': {'ref_count': 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def release_reference(checksum):
+        """
+        Drop a reference to stored content
+
+        Returns:
+            dict: Updated blob document or None if the content is not stored
+        """
+        db = get_db()
+        return db.blobs.find_one_and_update(
+            {'_id': checksum},
+            {'$inc': {'ref_count': -1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def delete_unreferenced(checksum):
+        """
+        Remove a blob record once nothing references it
+
+        The ref_count condition makes this a no-op if a concurrent upload
+        re-referenced the content in the meantime.
+
+        Returns:
+            bool: True if the blob record was removed
+        """
+        db = get_db()
+        result = db.blobs.delete_one({'_id': checksum, 'ref_count': {'$lte': 0}})
+        return result.deleted_count > 0
+
+    @staticmethod
+    def get_referenced_refs(storage_backend, storage_refs):
+        """Get which of the given storage references belong to a blob"""
+        db = get_db()
+        blobs = db.blobs.find(
+            {'storage_backend': storage_backend, 'storage_ref': {'$in': storage_refs}},
+            {'storage_ref': 1}
+        )
+        return {blob['storage_ref'] for blob in blobs}
+
+    @staticmethod
+    def get_unreferenced_blobs(limit=0):
+        """Get blobs left without references, e.g. by an interrupted release"""
+        db = get_db()
+        return db.blobs.find({'ref_count': {'$lte': 0}}).limit(limit)
@@ -1,14 +1,27 @@
 """
 File model for storing file metadata.
 """
+import secrets
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import DESCENDING, ReturnDocument
 from app.utils.db import get_db
+from app.utils.pagination import DEFAULT_PAGE_SIZE, keyset_condition, split_page
 
 
 class File:
+    # How long records of deleted or expired files are kept once their
+    # content is released; a TTL index on purge_at removes them afterwards
+    METADATA_RETENTION = timedelta(days=30)
+    # How long a counted download may be resumed without counting again
+    RESUME_CLAIM_MAX_AGE = timedelta(hours=1)
+    # Resume claims kept per file, the oldest are dropped first
+    RESUME_CLAIMS_KEPT = 20
+
     def __init__(self, filename, original_filename, file_size, file_type, 
-                 uploader_id, expiration_hours=24, password=None, download_limit=None):
+                 uploader_id, expiration_hours=24, password=None, download_limit=None,
+                 access_token=None, checksum=None, storage_backend=None, storage_ref=None):
+        self._id = ObjectId()  # Generated client-side so callers know it before inserting
         self.filename = filename
         self.original_filename = original_filename
         self.file_size = file_size
@@ -20,11 +33,15 @@ class File:
         self.download_limit = download_limit
         self.download_count = 0
         self.is_active = True
-        self.access_token = None  # For public access
+        self.access_token = access_token  # For public access
+        self.checksum = checksum  # Blob holding the file content
+        self.storage_backend = storage_backend
+        self.storage_ref = storage_ref
 
     def to_dict(self):
         """Convert file object to dictionary"""
         return {
+            '_id': self._id,
             'filename': self.filename,
             'original_filename': self.original_filename,
             'file_size': self.file_size,
@@ -36,19 +53,24 @@ class File:
             'download_limit': self.download_limit,
             'download_count': self.download_count,
             'is_active': self.is_active,
-            'access_token': self.access_token
+            'access_token': self.access_token,
+            'checksum': self.checksum,
+            'storage_backend': self.storage_backend,
+            'storage_ref': self.storage_ref
         }
 
     @staticmethod
     def create_file(filename, original_filename, file_size, file_type, 
-                   uploader_id, expiration_hours=24, password=None, download_limit=None):
-        """Create a new file record in the database"""
+                   uploader_id, expiration_hours=24, password=None, download_limit=None,
+                   access_token=None, checksum=None, storage_backend=None, storage_ref=None):
+        """Create a new file record in the database with a single insert"""
         db = get_db()
         file_obj = File(filename, original_filename, file_size, file_type, 
-                       uploader_id, expiration_hours, password, download_limit)
+                       uploader_id, expiration_hours, password, download_limit,
+                       access_token, checksum, storage_backend, storage_ref)
         
-        result = db.files.insert_one(file_obj.to_dict())
-        return str(result.inserted_id)
+        db.files.insert_one(file_obj.to_dict())
+        return str(file_obj._id)
 
     @staticmethod
     def get_file_by_id(file_id):
@@ -67,16 +89,60 @@ class File:
         return db.files.find_one({'filename': filename})
 
     @staticmethod
-    def get_files_by_uploader(uploader_id, include_expired=False):
-        """Get all files uploaded by a specific user"""
+    def get_files_by_uploader(uploader_id, include_expired=False, limit=DEFAULT_PAGE_SIZE,
+                              cursor=None, projection=None):
+        """
+        Get a page of files uploaded by a specific user, newest first
+
+        Args:
+            limit: Page size
+            cursor: Continuation token of the previous page
+            projection: Fields to fetch
+
+        Returns:
+            tuple: (file records, cursor of the next page or None)
+        """
         db = get_db()
         query = {'uploader_id': uploader_id}
         
         if not include_expired:
             query['is_active'] = True
             query['expiration_date'] = {'$gt': datetime.utcnow()}
-            
-        return list(db.files.find(query).sort('upload_date', -1))
+        
+        if cursor:
+            query.update(keyset_condition('upload_date', DESCENDING, cursor))
+        
+        files = db.files.find(query, projection) \
+            .sort([('upload_date', DESCENDING), ('_id', DESCENDING)]) \
+            .limit(limit + 1)
+        return split_page(list(files), limit, 'upload_date')
+
+    @staticmethod
+    def get_uploader_stats(uploader_id):
+        """
+        Get the totals of a user's active files, computed by the database
+
+        Returns:
+            dict: total_files, total_downloads and storage_used
+        """
+        db = get_db()
+        totals = list(db.files.aggregate([
+            {'$match': {
+                'uploader_id': uploader_id,
+                'is_active': True,
+                'expiration_date': {'$gt': datetime.utcnow()}
+            }},
+            {'$group': {
+                '_id': None,
+                'total_files': {'$sum': 1},
+                'total_downloads': {'$sum': '$download_count'},
+                'storage_used': {'$sum': '$file_size'}
+            }}
+        ]))
+        if not totals:
+            return {'total_files': 0, 'total_downloads': 0, 'storage_used': 0}
+        totals[0].pop('_id')
+        return totals[0]
 
     @staticmethod
     def update_download_count(file_id):
@@ -96,6 +162,48 @@ class File:
             {'$set': {'is_active': False}}
         )
 
+    @staticmethod
+    def mark_storage_released(file_id):
+        """
+        Deactivate a file and flag its stored content as released
+
+        The record itself is purged by the TTL index after
+        METADATA_RETENTION.
+
+        Returns:
+            bool: True if this call released the storage, False if it was
+            already released by an earlier delete or cleanup
+        """
+        db = get_db()
+        result = db.files.update_one(
+            {'_id': ObjectId(file_id), 'storage_released': {'$ne': True}},
+            {'$set': {
+                'is_active': False,
+                'storage_released': True,
+                'purge_at': datetime.utcnow() + File.METADATA_RETENTION
+            }}
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    def get_unreleased_inactive_files(limit=0):
+        """Get inactive files whose stored content has not been released yet"""
+        db = get_db()
+        return db.files.find(
+            {'is_active': False, 'storage_released': {'$ne': True}},
+            {'checksum': 1, 'storage_backend': 1, 'storage_ref': 1, 'gridfs_id': 1}
+        ).limit(limit)
+
+    @staticmethod
+    def get_unreleased_gridfs_ids(gridfs_ids):
+        """Get which GridFS files are still owned by records stored before deduplication"""
+        db = get_db()
+        records = db.files.find(
+            {'gridfs_id': {'$in': gridfs_ids}, 'storage_released': {'$ne': True}},
+            {'gridfs_id': 1}
+        )
+        return {record['gridfs_id'] for record in records}
+
     @staticmethod
     def delete_expired_files():
         """Mark expired files as inactive"""
@@ -114,19 +222,155 @@ class File:
         if not file_data:
             return False, "File not found"
         
+        reason = File.access_denied_reason(file_data, password)
+        if reason:
+            return False, reason
+        
+        return True, "Access granted"
+
+    @staticmethod
+    def access_denied_reason(file_data, password=None):
+        """Get why a file record may not be downloaded, or None if it may"""
         if not file_data['is_active']:
-            return False, "File is no longer available"
+            return "File is no longer available"
         
         if file_data['expiration_date'] < datetime.utcnow():
-            return False, "File has expired"
+            return "File has expired"
         
         if file_data['download_limit'] and file_data['download_count'] >= file_data['download_limit']:
-            return False, "Download limit reached"
+            return "Download limit reached"
         
         if file_data['password'] and file_data['password'] != password:
-            return False, "Invalid password"
+            return "Invalid password"
         
-        return True, "Access granted"
+        return None
+
+    # Fields needed to stream a file once access is granted
+    DOWNLOAD_PROJECTION = {
+        'original_filename': 1, 'file_type': 1, 'file_size': 1, 'upload_date': 1,
+        'expiration_date': 1, 'download_limit': 1, 'checksum': 1, 'storage_backend': 1,
+        'storage_ref': 1, 'gridfs_id': 1
+    }
+
+    @staticmethod
+    def download_query(file_id=None, access_token=None, password=None, resume=None):
+        """
+        Build a query matching a file only while it may be downloaded
+
+        Encodes the same rules as check_file_access so they can be checked
+        by the database in the same operation that counts the download.
+        A resume (claim_id, range_start) of a download that was already
+        counted matches through its unexpired resume claim instead of the
+        download limit, which that download may have used up, and only if
+        the range starts inside the file.
+        """
+        query = {'_id': ObjectId(file_id)} if file_id else {'access_token': access_token}
+        conditions = [
+            {'$or': [
+                {'password': None},
+                {'password': ''},
+                {'password': password}
+            ]}
+        ]
+        if resume:
+            claim_id, range_start = resume
+            query['resume_claims'] = {'$elemMatch': {
+                'id': claim_id,
+                'expires_at': {'$gte': datetime.utcnow()}
+            }}
+            query['file_size'] = {'$gt': range_start}
+        else:
+            conditions.insert(0, {'$or': [
+                {'download_limit': None},
+                {'download_limit': 0},
+                {'$expr': {'$lt': ['$download_count', '$download_limit']}}
+            ]})
+        query.update({
+            'is_active': True,
+            'expiration_date': {'$gte': datetime.utcnow()},
+            '$and': conditions
+        })
+        return query
+
+    @staticmethod
+    def claim_download(file_id=None, access_token=None, password=None, count_download=True, resume=None):
+        """
+        Authorize a download and count it in one atomic operation
+
+        The active, expiry, limit and password checks and the counter
+        increment happen in a single find_one_and_update, so concurrent
+        downloads cannot exceed download_limit.
+
+        Each counted download records a resume claim on the file, valid for
+        RESUME_CLAIM_MAX_AGE, that lets its client fetch the rest of the
+        file without counting again. A resume consumes its claim and gets
+        a new one with the same expiry, so a claim serves one client's
+        download only. Resumes whose claim is gone are counted as new
+        downloads.
+
+        Args:
+            file_id: ID of the file, or
+            access_token: Share token of the file
+            count_download: Whether to increment download_count
+            resume: (claim_id, range_start) of a request resuming a counted
+                download (see utils.http.get_resume_claim), or None
+
+        Returns:
+            tuple: (file_data, None) with DOWNLOAD_PROJECTION fields, and
+            the new resume claim as resume_claim, if granted, (None, reason)
+            if denied
+        """
+        try:
+            query = File.download_query(file_id, access_token, password)
+        except Exception:
+            return None, "File not found"
+        
+        db = get_db()
+        if resume:
+            file_data = db.files.find_one_and_update(
+                File.download_query(file_id, access_token, password, resume=resume),
+                {'$set': {'resume_claims.$.id': File._new_resume_claim_id()}},
+                projection=dict(File.DOWNLOAD_PROJECTION, **{'resume_claims.$': 1}),
+                return_document=ReturnDocument.AFTER
+            )
+            if file_data:
+                file_data['resume_claim'] = file_data.pop('resume_claims')[0]['id']
+                file_data['resumed'] = True
+                return file_data, None
+
+        if count_download:
+            claim = {
+                'id': File._new_resume_claim_id(),
+                'expires_at': datetime.utcnow() + File.RESUME_CLAIM_MAX_AGE
+            }
+            file_data = db.files.find_one_and_update(
+                query,
+                {
+                    '$inc': {'download_count': 1},
+                    '$push': {'resume_claims': {'$each': [claim], '$slice': -File.RESUME_CLAIMS_KEPT}}
+                },
+                projection=File.DOWNLOAD_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+            if file_data:
+                file_data['resume_claim'] = claim['id']
+        else:
+            file_data = db.files.find_one(query, File.DOWNLOAD_PROJECTION)
+        
+        if file_data:
+            return file_data, None
+        
+        # Denied, look the record up again only to explain why
+        lookup = {'_id': query['_id']} if file_id else {'access_token': access_token}
+        file_data = db.files.find_one(lookup)
+        if not file_data:
+            return None, "File not found" if file_id else "Invalid or expired share link"
+        
+        return None, File.access_denied_reason(file_data, password) or "File is no longer available"
+
+    @staticmethod
+    def _new_resume_claim_id():
+        return secrets.token_urlsafe(16)
 
     def is_expired(self):
         """Check if file is expired"""
@@ -0,0 +1,52 @@
+"""
+Revoked token model for logout and refresh token rotation.
+"""
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from app.utils.db import get_db
+
+
+class RevokedToken:
+    """
+    A JWT that must no longer be accepted, keyed by its jti claim
+
+    Records are kept until the token would have expired anyway.
+    """
+
+    @staticmethod
+    def revoke(jti, user_id, token_type, expires_at):
+        """
+        Revoke a token
+
+        Returns:
+            bool: False if the token was already revoked
+        """
+        db = get_db()
+        try:
+            # revoked_at comes from the server clock, the same for every node
+            result = db.revoked_tokens.update_one(
+                {'_id': jti},
+                {
+                    '$setOnInsert': {'user_id': str(user_id), 'type': token_type, 'expires_at': expires_at},
+                    '$currentDate': {'revoked_at': True}
+                },
+                upsert=True
+            )
+            return result.upserted_id is not None
+        except DuplicateKeyError:
+            return False
+
+    @staticmethod
+    def get_revoked_since(since=None, overlap=timedelta(0)):
+        """
+        Get the unexpired revocations made at or after a time, oldest first
+
+        Revocations can become visible out of revoked_at order, so callers
+        pulling increments re-read an overlap window before `since`.
+        """
+        db = get_db()
+        query = {'expires_at': {'$gt': datetime.utcnow()}}
+        if since:
+            query['revoked_at'] = {'$gte': since - overlap}
+        return list(db.revoked_tokens.find(query, {'expires_at': 1, 'revoked_at': 1}).sort('revoked_at', ASCENDING))
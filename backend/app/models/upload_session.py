@@ -0,0 +1,151 @@
+"""
+Upload session model for resumable chunked uploads.
+"""
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.utils.db import get_db
+
+
+class UploadSession:
+    """
+    A resumable upload in progress
+
+    A session tracks how many bytes of a file have been written to
+    partial storage. Only one request may append to a session at a time,
+    which is enforced with a short lock lease on the session document.
+    """
+
+    SESSION_TTL = timedelta(hours=24)  # Idle time before a session is abandoned
+    LOCK_LEASE = timedelta(minutes=5)  # Longest time a single append may hold the lock
+
+    @staticmethod
+    def create_session(uploader_id, original_filename, file_size, storage_backend,
+                       storage_ref, expiration_hours=24, password=None, download_limit=None):
+        """Create a new upload session"""
+        db = get_db()
+        now = datetime.utcnow()
+        result = db.upload_sessions.insert_one({
+            'uploader_id': uploader_id,
+            'original_filename': original_filename,
+            'file_size': file_size,
+            'offset': 0,
+            'storage_backend': storage_backend,
+            'storage_ref': storage_ref,
+            'expiration_hours': expiration_hours,
+            'password': password,
+            'download_limit': download_limit,
+            'locked_until': None,
+            'created_at': now,
+            'expires_at': now + UploadSession.SESSION_TTL
+        })
+        return str(result.inserted_id)
+
+    @staticmethod
+    def get_session(session_id, uploader_id):
+        """Get an upload session owned by a user"""
+        try:
+            db = get_db()
+            return db.upload_sessions.find_one({
+                '_id': ObjectId(session_id),
+                'uploader_id': uploader_id
+            })
+        except Exception:
+            return None
+
+    @staticmethod
+    def lock_session(session_id, uploader_id, offset=None):
+        """
+        Take the append lock of a session
+
+        Args:
+            offset: If given, only lock when the session is at this offset
+
+        Returns:
+            dict: The locked session or None if it is missing, busy or at
+            a different offset
+        """
+        db = get_db()
+        now = datetime.utcnow()
+        query = {
+            '_id': ObjectId(session_id),
+            'uploader_id': uploader_id,
+            '$or': [{'locked_until': None}, {'locked_until': {'$lt': now}}]
+        }
+        if offset is not None:
+            query['offset'] = offset
+
+        return db.upload_sessions.find_one_and_update(
+            query,
+            {'$set': {'locked_until': now + UploadSession.LOCK_LEASE}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def unlock_session(session_id, offset=None):
+        """Release the append lock, recording the new offset if given"""
+        db = get_db()
+        update = {
+            'locked_until': None,
+            'expires_at': datetime.utcnow() + UploadSession.SESSION_TTL
+        }
+        if offset is not None:
+            update['offset'] = offset
+
+        db.upload_sessions.update_one({'_id': ObjectId(session_id)}, {'$set': update})
+
+    @staticmethod
+    def record_commit(session_id, committed_ref):
+        """Record where the session's content was committed to, for retries"""
+        db = get_db()
+        db.upload_sessions.update_one({'_id': ObjectId(session_id)}, {'$set': {'committed_ref': committed_ref}})
+
+    @staticmethod
+    def record_blob(session_id, checksum):
+        """Record the blob the session holds a reference to, for retries"""
+        db = get_db()
+        db.upload_sessions.update_one({'_id': ObjectId(session_id)}, {'$set': {'checksum': checksum}})
+
+    @staticmethod
+    def delete_session(session_id):
+        """Delete an upload session"""
+        db = get_db()
+        db.upload_sessions.delete_one({'_id': ObjectId(session_id)})
+
+    @staticmethod
+    def lock_abandoned_session():
+        """
+        Take the lock of one session idle for longer than SESSION_TTL
+
+        Returns:
+            dict: The locked session or None if no session is abandoned
+        """
+        db = get_db()
+        now = datetime.utcnow()
+        return db.upload_sessions.find_one_and_update(
+            {
+                'expires_at': {'$lt': now},
+                '$or': [{'locked_until': None}, {'locked_until': {'$lt': now}}]
+            },
+            {'$set': {'locked_until': now + UploadSession.LOCK_LEASE}}
+        )
+
+    @staticmethod
+    def get_session_refs(storage_backend, storage_refs):
+        """Get which of the given partial storage references belong to a session"""
+        db = get_db()
+        sessions = db.upload_sessions.find(
+            {'storage_backend': storage_backend, 'storage_ref': {'$in': storage_refs}},
+            {'storage_ref': 1}
+        )
+        return {session['storage_ref'] for session in sessions}
+
+    @staticmethod
+    def get_committed_refs(storage_backend, storage_refs):
+        """Get which of the given stored content references a session committed but not yet registered"""
+        db = get_db()
+        sessions = db.upload_sessions.find(
+            {'storage_backend': storage_backend, 'committed_ref': {'$in': storage_refs}},
+            {'committed_ref': 1}
+        )
+        return {session['committed_ref'] for session in sessions}
@@ -1,10 +1,23 @@
 """
 User model for the application.
 """
+import os
 from datetime import datetime
 from bson import ObjectId
-import bcrypt
+from pymongo import ASCENDING
 from app.utils.db import get_db
+from app.utils.passwords import password_hasher
+from app.utils.cache import TTLCache, VersionStamp
+from app.utils.pagination import DEFAULT_PAGE_SIZE, keyset_condition, split_page
+
+# User records by ID, so authorization checks don't query MongoDB each time
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))  # 0 disables the cache
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
+# Seconds between checks for changes made by other worker processes
+USER_CACHE_VERSION_CHECK = float(os.environ.get('USER_CACHE_VERSION_CHECK', 2))
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+user_cache_version = VersionStamp('users', user_cache, USER_CACHE_VERSION_CHECK)
 
 class User:
     """User model class for authentication and user management"""
@@ -38,13 +51,67 @@ class User:
         user_data = db.users.find_one({"email": email})
         return cls.from_dict(user_data) if user_data else None
 
+    @classmethod
+    def find_by_login(cls, username_or_email):
+        """
+        Find a user by username or email in a single query
+
+        A username match wins over another user's email match.
+        """
+        db = get_db()
+        users_data = list(db.users.find(
+            {"$or": [{"username": username_or_email}, {"email": username_or_email}]}
+        ).limit(2))
+        for user_data in users_data:
+            if user_data.get("username") == username_or_email:
+                return cls.from_dict(user_data)
+        return cls.from_dict(users_data[0]) if users_data else None
+
     @classmethod
     def find_by_id(cls, user_id):
-        """Find a user by ID"""
+        """
+        Find a user by ID
+
+        Served from the user cache when possible, so changes made by
+        another worker process may take a moment to show up.
+        """
+        if USER_CACHE_SIZE > 0:
+            user_cache_version.check()
+            user_data = user_cache.get(str(user_id))
+            if user_data is not None:
+                return cls.from_dict(user_data)
+
         db = get_db()
         user_data = db.users.find_one({"_id": ObjectId(user_id)})
+        if user_data and USER_CACHE_SIZE > 0:
+            user_cache.set(str(user_id), user_data)
         return cls.from_dict(user_data) if user_data else None
 
+    @staticmethod
+    def invalidate_cache():
+        """Drop cached users in every worker process after a change"""
+        if USER_CACHE_SIZE > 0:
+            user_cache_version.bump()
+
+    @classmethod
+    def get_users_page(cls, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        Get a page of users ordered by creation date
+
+        Password hashes are not fetched.
+
+        Returns:
+            tuple: (User objects, cursor of the next page or None)
+        """
+        db = get_db()
+        query = keyset_condition('created_at', ASCENDING, cursor) if cursor else {}
+        users_data = db.users.find(query, {'password': 0}) \
+            .sort([('created_at', ASCENDING), ('_id', ASCENDING)]) \
+            .limit(limit + 1)
+        
+        page, next_cursor = split_page(list(users_data), limit, 'created_at')
+        return [cls.from_dict(user_data) for user_data in page], next_cursor
+
     @classmethod
     def from_dict(cls, user_dict):
         """Create a User object from a dictionary"""
@@ -97,6 +164,7 @@ class User:
                 {"_id": ObjectId(self._id)},
                 {"$set": user_data}
             )
+            User.invalidate_cache()
             return self
         else:
             # Create new user
@@ -107,19 +175,42 @@ class User:
             return self
 
     def hash_password(self, password):
-        """Hash password using bcrypt"""
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        self.password = hashed.decode('utf-8')
+        """
+        Hash password using bcrypt on the password hashing pool
+
+        Raises PasswordHasherBusy when the pool is saturated.
+        """
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password):
-        """Check if password is correct"""
+        """
+        Check if password is correct
+
+        Raises PasswordHasherBusy when the pool is saturated.
+        """
         if not self.password:
             return False
-        return bcrypt.checkpw(
-            password.encode('utf-8'),
-            self.password.encode('utf-8')
+        return password_hasher.check(password, self.password)
+
+    def password_needs_rehash(self):
+        """Check if the password hash was made with an outdated cost factor"""
+        return bool(self.password) and password_hasher.needs_rehash(self.password)
+
+    def update_password_hash(self, new_hash):
+        """
+        Replace the stored password hash without touching other fields
+
+        Only applies if the password was not changed in the meantime.
+        """
+        db = get_db()
+        result = db.users.update_one(
+            {"_id": ObjectId(self._id), "password": self.password},
+            {"$set": {"password": new_hash}}
         )
+        if result.modified_count:
+            self.password = new_hash
+            User.invalidate_cache()
+        return result.modified_count > 0
 
     def delete(self):
         """Delete user from database"""
@@ -128,4 +219,5 @@ class User:
         
         db = get_db()
         result = db.users.delete_one({"_id": ObjectId(self._id)})
+        User.invalidate_cache()
         return result.deleted_count > 0
@@ -0,0 +1,97 @@
+"""
+Administration routes for maintenance and diagnostics
+"""
+from flask import Blueprint, jsonify, current_app, send_file
+from app.scheduler import get_job_stats
+from app.models.user import user_cache
+from app.routes.files import file_service
+from app.utils.auth import admin_required, token_cache
+from app.utils.revocation import revocation_list
+
+# Create blueprint
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/jobs', methods=['GET'])
+@admin_required
+def get_jobs(user_id):
+    """
+    Get timing and last-run statistics of scheduled maintenance jobs
+    ---
+    headers:
+      Authorization: Bearer <access_token>
+    """
+    jobs = get_job_stats()
+    
+    return jsonify({
+        "jobs": jobs,
+        "count": len(jobs)
+    }), 200
+
+@admin_bp.route('/cache', methods=['GET'])
+@admin_required
+def get_cache_stats(user_id):
+    """
+    Get hit and miss counters of the in-process caches of this worker
+    ---
+    headers:
+      Authorization: Bearer <access_token>
+    """
+    return jsonify({
+        "caches": {
+            "users": user_cache.stats(),
+            "tokens": token_cache.stats(),
+            "revoked_tokens": revocation_list.stats(),
+            "files": file_service.content_cache.stats(),
+            "files_disk": file_service.disk_cache.stats()
+        }
+    }), 200
+
+@admin_bp.route('/rate-limits', methods=['GET'])
+@admin_required
+def get_rate_limit_stats(user_id):
+    """
+    Get the rate limit rules and decision counters of this worker
+    ---
+    headers:
+      Authorization: Bearer <access_token>
+    """
+    limiter = current_app.extensions.get('rate_limiter')
+    
+    return jsonify({
+        "enabled": limiter is not None,
+        "rate_limits": limiter.stats() if limiter else None
+    }), 200
+
+@admin_bp.route('/profiles', methods=['GET'])
+@admin_required
+def list_profiles(user_id):
+    """
+    List the most recent request profiles, newest first
+    ---
+    headers:
+      Authorization: Bearer <access_token>
+    """
+    profiles = current_app.extensions['profiles'].list_profiles()
+    
+    return jsonify({
+        "enabled": current_app.config['PROFILER_ENABLED'],
+        "sample_rate": current_app.config['PROFILE_SAMPLE_RATE'],
+        "profiles": profiles,
+        "count": len(profiles)
+    }), 200
+
+@admin_bp.route('/profiles/<name>', methods=['GET'])
+@admin_required
+def download_profile(user_id, name):
+    """
+    Download a request profile (.prof is pstats, .txt is collapsed stacks)
+    ---
+    headers:
+      Authorization: Bearer <access_token>
+    """
+    path = current_app.extensions['profiles'].get_path(name)
+    if not path:
+        return jsonify({"error": "Profile not found"}), 404
+    
+    mimetype = 'text/plain' if name.endswith('.txt') else 'application/octet-stream'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=name)
@@ -3,11 +3,19 @@ Authentication routes for login, register, and token refresh
 """
 from flask import Blueprint, request, jsonify
 from app.services.auth_service import AuthService
-from app.utils.auth import token_required
+from app.utils.auth import token_required, decode_token, get_token_from_header
+from app.utils.passwords import PasswordHasherBusy
 
 # Create blueprint
 auth_bp = Blueprint('auth', __name__)
 
+@auth_bp.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    """Reject the request when password hashing is saturated"""
+    response = jsonify({"error": str(error)})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """
@@ -42,8 +50,8 @@ def register():
     if error:
         return jsonify({"error": error}), 400
     
-    # Generate tokens
-    tokens, _ = AuthService.login(data['username'], data['password'])
+    # Generate tokens for the new user, the password was just hashed
+    tokens = AuthService.issue_tokens(user)
     
     return jsonify({
         "message": "User registered successfully",
@@ -106,6 +114,25 @@ def refresh_token():
         "tokens": tokens
     }), 200
 
+@auth_bp.route('/logout', methods=['POST'])
+@token_required
+def logout(user_id):
+    """
+    Revoke the current access token and, if given, the refresh token
+    ---
+    headers:
+      Authorization: Bearer <access_token>
+    request body:
+      refresh_token: (optional) refresh token of the session
+    """
+    data = request.get_json(silent=True) or {}
+    
+    AuthService.logout(decode_token(get_token_from_header()), data.get('refresh_token'))
+    
+    return jsonify({
+        "message": "Logged out successfully"
+    }), 200
+
 @auth_bp.route('/me', methods=['GET'])
 @token_required
 def get_user_profile(user_id):
@@ -138,8 +165,6 @@ def change_password(user_id):
       current_password: current password
       new_password: new password
     """
-    from app.models import User
-    
     data = request.get_json()
     
     # Validate required fields
@@ -150,19 +175,15 @@ def change_password(user_id):
     if len(data['new_password']) < 8:
         return jsonify({"error": "New password must be at least 8 characters"}), 400
     
-    # Get user
-    user = User.find_by_id(user_id)
-    
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-    
-    # Verify current password
-    if not user.check_password(data['current_password']):
-        return jsonify({"error": "Current password is incorrect"}), 401
+    # Change password
+    success, error = AuthService.change_password(
+        user_id,
+        data['current_password'],
+        data['new_password']
+    )
     
-    # Update password
-    user.hash_password(data['new_password'])
-    user.save()
+    if not success:
+        return jsonify({"error": error}), 404 if error == "User not found" else 401
     
     return jsonify({
         "message": "Password changed successfully"
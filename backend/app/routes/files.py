@@ -1,15 +1,22 @@
 """
 File upload and management routes.
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, url_for
 from werkzeug.exceptions import RequestEntityTooLarge
-import io
 from app.services.file_service import FileService
-from app.utils.auth import token_required
+from app.services.upload_service import UploadService
+from app.scheduler import schedule_jobs_now
+from app.utils.auth import token_required, admin_required
+from app.utils.http import (
+    is_new_download, get_resume_claim, set_resume_token, send_stored_file, is_conditional_download,
+    is_not_modified, not_modified, send_revalidated_json
+)
+from app.utils.pagination import parse_page_size
 
 
 file_bp = Blueprint('files', __name__)
 file_service = FileService()
+upload_service = UploadService(file_service)
 
 
 @file_bp.errorhandler(RequestEntityTooLarge)
@@ -76,6 +83,211 @@ def upload_fileuser(user_id):
         }), 500
 
 
+def _upload_headers(session_data):
+    """Resumable upload headers describing a session"""
+    return {
+        'Upload-Offset': str(session_data['offset']),
+        'Upload-Length': str(session_data['file_size']),
+        'Cache-Control': 'no-store'
+    }
+
+
+@file_bp.route('/uploads', methods=['POST'])
+@token_required
+def create_upload_session(user_id):
+    """Start a resumable upload"""
+    try:
+        data = request.get_json() or {}
+        
+        if not all(k in data for k in ['filename', 'file_size']):
+            return jsonify({
+                'success': False,
+                'message': 'Missing required fields'
+            }), 400
+        
+        try:
+            file_size = int(data['file_size'])
+            expiration_hours = int(data.get('expiration_hours', 24))
+            download_limit = int(data['download_limit']) if data.get('download_limit') else None
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid upload parameters'
+            }), 400
+        
+        success, message, session_data = upload_service.create_session(
+            uploader_id=user_id,
+            filename=data['filename'],
+            file_size=file_size,
+            expiration_hours=expiration_hours,
+            password=data.get('password'),
+            download_limit=download_limit
+        )
+        
+        if success:
+            headers = _upload_headers(session_data)
+            headers['Location'] = url_for('files.get_upload_status', upload_id=session_data['upload_id'])
+            return jsonify({
+                'success': True,
+                'message': message,
+                'data': session_data
+            }), 201, headers
+        else:
+            return jsonify({
+                'success': False,
+                'message': message
+            }), 500 if 'failed' in message.lower() else 400
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Upload failed: {str(e)}'
+        }), 500
+
+
+@file_bp.route('/uploads/<upload_id>', methods=['GET'])
+@token_required
+def get_upload_status(user_id, upload_id):
+    """Get the current offset of a resumable upload (also answers HEAD)"""
+    success, message, session_data = upload_service.get_status(upload_id, user_id)
+    
+    if not success:
+        return jsonify({
+            'success': False,
+            'message': message
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'message': message,
+        'data': session_data
+    }), 200, _upload_headers(session_data)
+
+
+@file_bp.route('/uploads/<upload_id>', methods=['PATCH'])
+@token_required
+def upload_chunk(user_id, upload_id):
+    """Append a chunk to a resumable upload at the offset in Upload-Offset"""
+    try:
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'Missing or invalid Upload-Offset header'
+            }), 400
+        
+        if request.content_length is None:
+            return jsonify({
+                'success': False,
+                'message': 'Content-Length header is required'
+            }), 411
+        
+        success, message, session_data = upload_service.append_chunk(
+            upload_id,
+            user_id,
+            offset,
+            request.stream,
+            request.content_length
+        )
+        
+        if success:
+            return jsonify({
+                'success': True,
+                'message': message,
+                'data': session_data
+            }), 200, _upload_headers(session_data)
+        
+        if 'not found' in message.lower():
+            status = 404
+        elif 'offset' in message.lower():
+            status = 409
+        elif 'exceeds' in message.lower():
+            status = 413
+        else:
+            status = 500
+        
+        response = jsonify({
+            'success': False,
+            'message': message,
+            'data': session_data
+        })
+        return response, status, _upload_headers(session_data) if session_data else {}
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Upload failed: {str(e)}'
+        }), 500
+
+
+@file_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@token_required
+def complete_upload(user_id, upload_id):
+    """Finish a resumable upload and create the file"""
+    success, message, file_data = upload_service.complete_session(upload_id, user_id)
+    
+    if success:
+        return jsonify({
+            'success': True,
+            'message': message,
+            'data': file_data
+        }), 201
+    
+    if 'not found' in message.lower():
+        status = 404
+    elif 'incomplete' in message.lower():
+        status = 409
+    else:
+        status = 500
+    
+    return jsonify({
+        'success': False,
+        'message': message
+    }), status
+
+
+@file_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@token_required
+def cancel_upload(user_id, upload_id):
+    """Cancel a resumable upload"""
+    success, message = upload_service.abort_session(upload_id, user_id)
+    
+    return jsonify({
+        'success': success,
+        'message': message
+    }), 200 if success else 404 if 'not found' in message.lower() else 500
+
+
+def _send_download(download_key, resume=True, **lookup):
+    """
+    Authorize, count and send a download
+
+    A request presenting a resume claim is served without counting it,
+    as long as it gets the partial response it asked for; otherwise it
+    counts as a new download.
+
+    Returns:
+        tuple: (success, message, response)
+    """
+    resume_claim = get_resume_claim(download_key) if resume else None
+    success, message, stored_file, filename, file_type, file_record = file_service.download_file(
+        count_download=is_new_download(),
+        resume=resume_claim,
+        **lookup
+    )
+    if not success:
+        return False, message, None
+
+    response = send_stored_file(stored_file, filename, file_type, file_record)
+    if file_record.get('resumed') and response.status_code != 206:
+        # The range was not served (e.g. If-Range mismatch), the whole
+        # file would be sent for free
+        response.close()
+        return _send_download(download_key, resume=False, **lookup)
+    return True, message, set_resume_token(response, download_key, file_record)
+
+
 @file_bp.route('/download/<file_id>', methods=['GET', 'POST'])
 def download_file(file_id):
     """Download a file"""
@@ -89,16 +301,17 @@ def download_file(file_id):
         else:
             password = request.args.get('password')
         
-        # Download file
-        success, message, file_content, filename, file_type = file_service.download_file(file_id, password)
+        # Revalidations are answered from metadata, without counting a download
+        if is_conditional_download():
+            success, message, file_record = file_service.authorize_download(file_id, password)
+            if success and is_not_modified(file_record, request.if_none_match, request.if_modified_since):
+                return not_modified(file_record)
+        
+        # Download file, resumes of a counted download are not counted again
+        success, message, response = _send_download(file_id, file_id=file_id, password=password)
         
         if success:
-            return send_file(
-                io.BytesIO(file_content),
-                as_attachment=True,
-                download_name=filename,
-                mimetype=file_type
-            )
+            return response
         else:
             return jsonify({
                 'success': False,
@@ -119,11 +332,11 @@ def get_file_info(file_id):
         success, message, file_info = file_service.get_file_info(file_id)
         
         if success:
-            return jsonify({
+            return send_revalidated_json({
                 'success': True,
                 'message': message,
                 'data': file_info
-            }), 200
+            })
         else:
             return jsonify({
                 'success': False,
@@ -140,26 +353,42 @@ def get_file_info(file_id):
 @file_bp.route('/my-files', methods=['GET'])
 @token_required
 def get_my_files(user_id):
-    """Get all files uploaded by the current user"""
+    """
+    Get files uploaded by the current user, one page at a time
+
+    Query parameters: include_expired, limit (max 100) and cursor, the
+    next_cursor of the previous page.
+    """
     try:
         include_expired = request.args.get('include_expired', 'false').lower() == 'true'
         
-        success, message, files = file_service.get_user_files(
+        try:
+            limit = parse_page_size(request.args.get('limit'))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid page size'
+            }), 400
+        
+        success, message, files, next_cursor = file_service.get_user_files(
             user_id, 
-            include_expired
+            include_expired,
+            limit=limit,
+            cursor=request.args.get('cursor')
         )
         
         if success:
             return jsonify({
                 'success': True,
                 'message': message,
-                'data': files
+                'data': files,
+                'next_cursor': next_cursor
             }), 200
         else:
             return jsonify({
                 'success': False,
                 'message': message
-            }), 500
+            }), 400 if 'cursor' in message.lower() else 500
             
     except Exception as e:
         return jsonify({
@@ -168,6 +397,26 @@ def get_my_files(user_id):
         }), 500
 
 
+@file_bp.route('/my-files/stats', methods=['GET'])
+@token_required
+def get_my_file_stats(user_id):
+    """Get the number, downloads and total size of the current user's active files"""
+    try:
+        success, message, stats = file_service.get_user_file_stats(user_id)
+        
+        return jsonify({
+            'success': success,
+            'message': message,
+            'data': stats
+        }), 200 if success else 500
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error retrieving file stats: {str(e)}'
+        }), 500
+
+
 @file_bp.route('/delete/<file_id>', methods=['DELETE'])
 @token_required
 def delete_file(user_id, file_id):
@@ -229,11 +478,11 @@ def get_shared_file_info(access_token):
             'has_password': bool(file_record.get('password'))
         }
         
-        return jsonify({
+        return send_revalidated_json({
             'success': True,
             'message': 'File info retrieved',
             'data': file_info
-        }), 200
+        })
         
     except Exception as e:
         return jsonify({
@@ -246,19 +495,6 @@ def get_shared_file_info(access_token):
 def download_shared_file(access_token):
     """Download a file using access token"""
     try:
-        from app.utils.db import get_db
-        
-        db = get_db()
-        file_record = db.files.find_one({'access_token': access_token})
-        
-        if not file_record:
-            return jsonify({
-                'success': False,
-                'message': 'Invalid or expired share link'
-            }), 404
-        
-        file_id = str(file_record['_id'])
-        
         password = None
         if request.method == 'POST':
             data = request.get_json()
@@ -266,21 +502,30 @@ def download_shared_file(access_token):
         else:
             password = request.args.get('password')
         
-        # Download file
-        success, message, file_content, filename, file_type = file_service.download_file(file_id, password)
+        # Revalidations are answered from metadata, without counting a download
+        if is_conditional_download():
+            success, message, file_record = file_service.authorize_download(
+                password=password,
+                access_token=access_token
+            )
+            if success and is_not_modified(file_record, request.if_none_match, request.if_modified_since):
+                return not_modified(file_record)
+        
+        # Download file, resumes of a counted download are not counted again
+        success, message, response = _send_download(access_token, password=password, access_token=access_token)
         
         if success:
-            return send_file(
-                io.BytesIO(file_content),
-                as_attachment=True,
-                download_name=filename,
-                mimetype=file_type
-            )
+            return response
+        elif 'share link' in message.lower():
+            return jsonify({
+                'success': False,
+                'message': message
+            }), 404
         else:
             return jsonify({
                 'success': False,
                 'message': message
-            }), 400 if 'not found' in message.lower() else 403
+            }), 403
             
     except Exception as e:
         return jsonify({
@@ -290,17 +535,36 @@ def download_shared_file(access_token):
 
 
 @file_bp.route('/cleanup', methods=['POST'])
-@token_required
+@admin_required
 def cleanup_expired_files(user_id):
-    """Cleanup expired files (admin function)"""
+    """
+    Run storage reclamation and the upload session purge now (admin function)
+
+    The jobs can take minutes, so they are handed to the maintenance
+    scheduler instead of running in the request.
+    """
     try:
-        # You might want to add admin role check here
-        success, message = file_service.cleanup_expired_files()
+        scheduled, running, unavailable = schedule_jobs_now(['reclaim_storage', 'purge_upload_sessions'])
         
+        if unavailable:
+            return jsonify({
+                'success': False,
+                'message': f'The maintenance scheduler is not running, could not schedule: {", ".join(unavailable)}'
+            }), 503
+        
+        if not scheduled:
+            return jsonify({
+                'success': False,
+                'message': 'Maintenance jobs are already running'
+            }), 409
+        
+        message = f'Scheduled to run now: {", ".join(scheduled)}'
+        if running:
+            message += f' (already running: {", ".join(running)})'
         return jsonify({
-            'success': success,
+            'success': True,
             'message': message
-        }), 200 if success else 500
+        }), 202
         
     except Exception as e:
         return jsonify({
@@ -4,6 +4,7 @@ User management routes for CRUD operations
 from flask import Blueprint, request, jsonify
 from app.models import User
 from app.utils.auth import token_required, admin_required
+from app.utils.pagination import parse_page_size
 
 # Create blueprint
 user_bp = Blueprint('users', __name__)
@@ -12,21 +13,26 @@ user_bp = Blueprint('users', __name__)
 @admin_required
 def get_all_users(user_id):
     """
-    Get all users (admin only)
+    Get users one page at a time (admin only)
     ---
     headers:
       Authorization: Bearer <access_token>
+    query:
+      limit: (optional) page size, max 100
+      cursor: (optional) next_cursor of the previous page
     """
-    from app.utils.db import get_db
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+        users, next_cursor = User.get_users_page(limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    db = get_db()
-    users_data = list(db.users.find())
-    
-    users = [User.from_dict(user_data).to_dict() for user_data in users_data]
+    users = [user.to_dict() for user in users]
     
     return jsonify({
         "users": users,
-        "count": len(users)
+        "count": len(users),
+        "next_cursor": next_cursor
     }), 200
 
 @user_bp.route('/<user_id>', methods=['GET'])
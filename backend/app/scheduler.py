@@ -0,0 +1,245 @@
+"""
+In-process scheduler for periodic maintenance jobs.
+"""
+import os
+import time
+import socket
+import random
+import threading
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.utils.db import get_db
+
+
+class Job:
+    """A maintenance task run every `interval`"""
+
+    def __init__(self, name, func, interval, lease=timedelta(minutes=30)):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.lease = lease  # Longest expected run time before the lock is considered stale
+
+
+class Scheduler:
+    """
+    Runs maintenance jobs periodically in a background thread
+
+    Every gunicorn worker (and any sidecar) may run a scheduler. Each job
+    has a document in the scheduler_jobs collection holding its next run
+    time and a lock lease; a scheduler only runs a job after atomically
+    taking that lock, so each run happens on exactly one process. The same
+    document keeps the timing and outcome of the last run.
+    """
+
+    POLL_INTERVAL = 10  # Seconds between checks for due jobs
+
+    def __init__(self, app, jobs=None):
+        self.app = app
+        self.jobs = {job.name: job for job in jobs or []}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, job):
+        """Register a job"""
+        self.jobs[job.name] = job
+
+    def _register_jobs(self):
+        """Create the lock documents of jobs that have never run"""
+        db = get_db()
+        for job in self.jobs.values():
+            try:
+                db.scheduler_jobs.update_one(
+                    {'_id': job.name},
+                    {'$setOnInsert': {
+                        'next_run_at': datetime.utcnow(),
+                        'locked_until': None,
+                        'owner': None,
+                        'runs': 0,
+                        'failures': 0
+                    }},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # Another process registered it at the same moment
+                pass
+
+    def _acquire(self, job):
+        """Take the lock of a due job, returns False if not due or held elsewhere"""
+        db = get_db()
+        now = datetime.utcnow()
+        locked = db.scheduler_jobs.find_one_and_update(
+            {
+                '_id': job.name,
+                'next_run_at': {'$lte': now},
+                '$or': [{'locked_until': None}, {'locked_until': {'$lt': now}}]
+            },
+            {'$set': {'owner': self.owner, 'locked_until': now + job.lease, 'last_started_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        return locked is not None
+
+    def _release(self, job, success, message, duration):
+        """Record the outcome of a run and schedule the next one"""
+        db = get_db()
+        now = datetime.utcnow()
+        db.scheduler_jobs.update_one(
+            {'_id': job.name, 'owner': self.owner},
+            {
+                '$set': {
+                    'locked_until': None,
+                    'next_run_at': now + job.interval,
+                    'last_finished_at': now,
+                    'last_duration_ms': round(duration * 1000, 1),
+                    'last_success': success,
+                    'last_message': message
+                },
+                '$inc': {'runs': 1, 'failures': 0 if success else 1}
+            }
+        )
+
+    def _heartbeat(self):
+        """Record that the jobs are being polled, see schedule_jobs_now"""
+        get_db().scheduler_jobs.update_many(
+            {'_id': {'$in': list(self.jobs)}},
+            {'$set': {'polled_at': datetime.utcnow()}}
+        )
+
+    def run_pending(self):
+        """Run every due job this process manages to lock"""
+        try:
+            self._heartbeat()
+        except Exception as e:
+            self.app.logger.warning("Scheduler could not record its poll: %s", e)
+
+        for job in self.jobs.values():
+            if self._stop.is_set():
+                return
+            
+            try:
+                if not self._acquire(job):
+                    continue
+            except Exception as e:
+                self.app.logger.warning("Scheduler could not lock job %s: %s", job.name, e)
+                continue
+            
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    result = job.func()
+                # Jobs follow the service convention of (success, message, ...)
+                success, message = result[0], result[1]
+            except Exception as e:
+                self.app.logger.exception("Scheduled job %s failed", job.name)
+                success, message = False, f"{job.name} failed: {str(e)}"
+            
+            try:
+                self._release(job, success, message, time.perf_counter() - started)
+            except Exception as e:
+                self.app.logger.error("Scheduler could not record run of job %s: %s", job.name, e)
+
+    def run_forever(self):
+        """Poll for due jobs until stopped"""
+        while not self._stop.is_set():
+            try:
+                self._register_jobs()
+                break
+            except Exception as e:
+                self.app.logger.warning("Scheduler could not register jobs: %s", e)
+                self._stop.wait(self.POLL_INTERVAL)
+        
+        while not self._stop.is_set():
+            self.run_pending()
+            # Jitter keeps workers started together from polling in lockstep
+            self._stop.wait(self.POLL_INTERVAL * random.uniform(0.5, 1.5))
+
+    def start(self):
+        """Run the scheduler in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='maintenance-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler after the current job"""
+        self._stop.set()
+
+
+def get_job_stats():
+    """Get the last-run statistics of every scheduled job"""
+    db = get_db()
+    jobs = []
+    for doc in db.scheduler_jobs.find().sort('_id', 1):
+        doc['name'] = doc.pop('_id')
+        jobs.append(doc)
+    return jobs
+
+
+def schedule_jobs_now(names):
+    """
+    Make jobs due immediately, for the next scheduler poll to run them
+
+    A job that is running at the time keeps its current run and is not
+    run a second time. Nothing is scheduled unless a scheduler is running
+    every job: each one must be registered, and a scheduler must have
+    polled it recently or hold its lock.
+
+    Returns:
+        tuple: (scheduled names, running names, names no scheduler runs)
+    """
+    db = get_db()
+    now = datetime.utcnow()
+    alive_since = now - timedelta(seconds=Scheduler.POLL_INTERVAL * 3)
+    jobs = {doc['_id']: doc for doc in db.scheduler_jobs.find({'_id': {'$in': list(names)}})}
+
+    # A scheduler busy with a long job stops polling, but holds its lock
+    scheduler_alive = any(
+        (job.get('polled_at') and job['polled_at'] >= alive_since)
+        or (job.get('locked_until') and job['locked_until'] >= now)
+        for job in jobs.values()
+    )
+    if not scheduler_alive or len(jobs) < len(names):
+        return [], [], [name for name in names if not scheduler_alive or name not in jobs]
+
+    scheduled, running = [], []
+    for name in names:
+        result = db.scheduler_jobs.update_one(
+            {'_id': name, '$or': [{'locked_until': None}, {'locked_until': {'$lt': now}}]},
+            {'$set': {'next_run_at': now}}
+        )
+        (scheduled if result.matched_count else running).append(name)
+    return scheduled, running, []
+
+
+def init_scheduler(app):
+    """
+    Create the maintenance scheduler of an application
+
+    The scheduler is stored in app.extensions['scheduler'] and started
+    when SCHEDULER_ENABLED is set. The sidecar entry point (scheduler.py)
+    runs it in the foreground instead.
+    """
+    from app.services.reclaim_service import ReclaimService
+    from app.services.upload_service import UploadService
+
+    scheduler = Scheduler(app, [
+        Job(
+            'reclaim_storage',
+            ReclaimService().run,
+            timedelta(minutes=app.config['RECLAIM_INTERVAL_MINUTES'])
+        ),
+        Job(
+            'purge_upload_sessions',
+            UploadService().purge_abandoned_sessions,
+            timedelta(minutes=app.config['UPLOAD_SESSION_PURGE_INTERVAL_MINUTES'])
+        )
+    ])
+    app.extensions['scheduler'] = scheduler
+
+    if app.config['SCHEDULER_ENABLED']:
+        scheduler.start()
+
+    return scheduler
@@ -3,8 +3,10 @@ Services package initialization.
 """
 from .auth_service import AuthService
 from .file_service import FileService
+from .upload_service import UploadService
+from .reclaim_service import ReclaimService
 
-__all__ = ['AuthService', 'FileService']
+__all__ = ['AuthService', 'FileService', 'UploadService', 'ReclaimService']
 from app.services.auth_service import AuthService
 
 __all__ = ['AuthService']
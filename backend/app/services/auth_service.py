@@ -1,8 +1,12 @@
 """
 Authentication service for user login and registration
 """
-from app.models import User
+import hashlib
+from datetime import datetime
+from app.models import User, RevokedToken
 from app.utils.auth import generate_token
+from app.utils.revocation import revocation_list
+from app.utils.passwords import password_hasher, PasswordHasherBusy
 
 class AuthService:
     """Service for authentication operations"""
@@ -58,12 +62,8 @@ class AuthService:
         Returns:
             tuple: (tokens_dict, User) if successful, (error_message, None) if failed
         """
-        # Try to find user by username
-        user = User.find_by_username(username_or_email)
-        
-        # If not found by username, try email
-        if not user:
-            user = User.find_by_email(username_or_email)
+        # Find user by username or email
+        user = User.find_by_login(username_or_email)
         
         # If user not found or inactive
         if not user:
@@ -76,22 +76,70 @@ class AuthService:
         if not user.check_password(password):
             return "Invalid password", None
         
-        # Generate tokens
+        # Upgrade hashes made with an outdated cost factor
+        if user.password_needs_rehash():
+            try:
+                user.update_password_hash(password_hasher.hash(password))
+            except PasswordHasherBusy:
+                pass  # Retried on a later login
+        
+        return AuthService.issue_tokens(user), user
+    
+    @staticmethod
+    def issue_tokens(user):
+        """
+        Generate an access and refresh token pair for a user
+        
+        Args:
+            user: Authenticated User object
+            
+        Returns:
+            dict: Tokens
+        """
         access_token = generate_token(user._id, "access")
         refresh_token = generate_token(user._id, "refresh")
         
-        tokens = {
+        return {
             "access_token": access_token,
             "refresh_token": refresh_token,
             "token_type": "Bearer"
         }
+    
+    @staticmethod
+    def change_password(user_id, current_password, new_password):
+        """
+        Change a user's password after verifying the current one
+        
+        Args:
+            user_id: ID of the user
+            current_password: The user's current password
+            new_password: The new password
+            
+        Returns:
+            tuple: (True, None) if successful, (False, error_message) if failed
+        """
+        user = User.find_by_id(user_id)
+        
+        if not user:
+            return False, "User not found"
+        
+        # Verify current password
+        if not user.check_password(current_password):
+            return False, "Current password is incorrect"
+        
+        # Update password
+        user.hash_password(new_password)
+        user.save()
         
-        return tokens, user
+        return True, None
     
     @staticmethod
     def refresh_token(refresh_token):
         """
-        Generate a new access token using a refresh token
+        Exchange a refresh token for a new access and refresh token pair
+        
+        Each refresh token can be used once; it is revoked as part of the
+        exchange.
         
         Args:
             refresh_token: The refresh token
@@ -110,6 +158,8 @@ class AuthService:
         if payload.get("type") != "refresh":
             return None, "Invalid token type"
         
+        payload = AuthService._with_token_id(payload, refresh_token)
+        
         user_id = payload.get("user_id")
         
         # Check if user exists
@@ -117,12 +167,54 @@ class AuthService:
         if not user or not user.is_active:
             return None, "User not found or inactive"
         
-        # Generate new tokens
-        new_access_token = generate_token(user._id, "access")
+        # Rotate: only the first exchange of a refresh token succeeds
+        if not AuthService.revoke_token(payload):
+            return None, "Refresh token has already been used"
         
-        tokens = {
-            "access_token": new_access_token,
-            "token_type": "Bearer"
-        }
+        return AuthService.issue_tokens(user), None
+    
+    @staticmethod
+    def logout(access_payload, refresh_token=None):
+        """
+        Revoke the access token of a session and, if given, its refresh token
+        
+        Args:
+            access_payload: Decoded access token of the request
+            refresh_token: (optional) Refresh token of the same user
+        """
+        from app.utils.auth import decode_token
         
-        return tokens, None
+        if access_payload.get("jti"):
+            AuthService.revoke_token(access_payload)
+        
+        if refresh_token:
+            payload = decode_token(refresh_token)
+            if payload and payload.get("type") == "refresh" \
+                    and payload.get("user_id") == access_payload.get("user_id"):
+                AuthService.revoke_token(AuthService._with_token_id(payload, refresh_token))
+    
+    @staticmethod
+    def _with_token_id(payload, token):
+        """
+        Give a decoded token an ID if it has none
+        
+        Refresh tokens issued before token IDs stay valid until they
+        expire; they are identified by their digest instead, so they can
+        still be exchanged only once and revoked.
+        """
+        if payload.get("jti"):
+            return payload
+        return dict(payload, jti=f"legacy-{hashlib.sha256(token.encode('utf-8')).hexdigest()}")
+    
+    @staticmethod
+    def revoke_token(payload):
+        """
+        Revoke a decoded token in the database and in this process
+        
+        Returns:
+            bool: False if the token was already revoked
+        """
+        expires_at = datetime.utcfromtimestamp(payload["exp"])
+        revoked = RevokedToken.revoke(payload["jti"], payload.get("user_id"), payload.get("type"), expires_at)
+        revocation_list.add(payload["jti"], expires_at)
+        return revoked
@@ -3,13 +3,17 @@ File service for handling file operations.
 """
 import os
 import uuid
+import hashlib
 import secrets
 import magic
-import gridfs
-from datetime import datetime
 from werkzeug.utils import secure_filename
 from app.utils.db import get_db
+from app.utils.pagination import DEFAULT_PAGE_SIZE
 from app.models.file import File
+from app.models.blob import Blob
+from app.storage import (
+    GridFSStorage, HashingReader, StoredFile, MemoryContent, DiskContent, get_storage, get_content_cache
+)
 
 
 class FileService:
@@ -21,18 +25,23 @@ class FileService:
     }
     
     MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+    UPLOAD_CHUNK_SIZE = 255 * 1024  # Matches the default GridFS chunk size
+    MIME_SNIFF_BYTES = 2048  # libmagic only needs the file header
     
-    def __init__(self):
-        pass
+    @property
+    def content_cache(self):
+        """Memory cache of popular small files of the current application"""
+        return get_content_cache('memory')
+    
+    @property
+    def disk_cache(self):
+        """Disk cache of larger files of the current application"""
+        return get_content_cache('disk')
     
     def _get_db(self):
         """Get a fresh database connection"""
         return get_db()
     
-    def _get_fs(self):
-        """Get a fresh GridFS connection"""
-        return gridfs.GridFS(self._get_db())
-    
     def allowed_file(self, filename):
         """Check if file extension is allowed"""
         return '.' in filename and \
@@ -72,93 +81,306 @@ class FileService:
         except Exception:
             return 'application/octet-stream'
     
+    def get_storage_location(self, document):
+        """
+        Get where the content of a file record or blob is stored
+
+        Documents written before storage backends were introduced only
+        carry a gridfs_id.
+
+        Returns:
+            tuple: (StorageBackend, reference)
+        """
+        if 'storage_ref' in document:
+            return get_storage(document['storage_backend']), document['storage_ref']
+        return get_storage(GridFSStorage.name), document['gridfs_id']
+
+    def delete_content(self, backend, storage_ref):
+        """Delete stored content and drop it from the content caches"""
+        self.content_cache.invalidate((backend.name, storage_ref))
+        self.disk_cache.invalidate((backend.name, storage_ref))
+        backend.delete(storage_ref)
+
+    def locate_content(self, backend, storage_ref, length):
+        """
+        Get a StoredFile for content, served from a cache when possible
+
+        Popular small files are served from memory once admitted to the
+        content cache. Larger files are copied to the disk cache on their
+        first download and sent from there afterwards. Content the backend
+        already keeps on the local filesystem is not cached.
+
+        Returns:
+            StoredFile: Location of the content for send_stored_file
+        """
+        key = (backend.name, storage_ref)
+        if backend.local_path(storage_ref):
+            return StoredFile(backend, storage_ref, length)
+
+        if self.content_cache.enabled and length <= self.content_cache.max_file_size:
+            data = self.content_cache.get(key)
+            if data is None and self.content_cache.should_admit(key, length):
+                with backend.open(storage_ref) as stored:
+                    data = stored.read()
+                self.content_cache.put(key, data)
+
+            if data is not None:
+                return StoredFile(MemoryContent(data), storage_ref, length)
+
+        elif self.disk_cache.enabled and length >= self.disk_cache.min_file_size:
+            cached = self.disk_cache.open(key)
+            if cached:
+                return StoredFile(DiskContent(cached), storage_ref, length)
+            self.disk_cache.fill_async(key, backend, storage_ref, length)
+
+        return StoredFile(backend, storage_ref, length)
+
+    def hash_stream(self, stream):
+        """
+        Hash a seekable stream without storing it
+
+        Returns:
+            str: SHA-256 hex digest, with the stream rewound to the start
+        """
+        hasher = hashlib.sha256()
+
+        block = stream.read(self.UPLOAD_CHUNK_SIZE)
+        while block:
+            hasher.update(block)
+            block = stream.read(self.UPLOAD_CHUNK_SIZE)
+
+        stream.seek(0)
+        return hasher.hexdigest()
+
+    def store_content(self, stream):
+        """
+        Store a stream in the content-addressed blob store
+
+        Seekable streams (werkzeug spools uploads to a temporary file) are
+        hashed first, so content that is already stored only gains a
+        reference and is never written again. Other streams are written
+        while hashing and deduplicated afterwards. Either way the content
+        is copied in UPLOAD_CHUNK_SIZE blocks, so memory use does not
+        depend on the file size.
+
+        Returns:
+            dict: Blob document describing the stored content
+        """
+        if hasattr(stream, 'seekable') and stream.seekable():
+            blob = Blob.add_reference(self.hash_stream(stream))
+            if blob:
+                return blob
+
+        backend = get_storage()
+        reader = HashingReader(stream, head_size=self.MIME_SNIFF_BYTES)
+        storage_ref = backend.save(reader)
+
+        return self.register_content(
+            backend,
+            storage_ref,
+            reader.hexdigest(),
+            reader.size,
+            self.detect_file_type(reader.head)
+        )
+
+    def register_content(self, backend, storage_ref, checksum, file_size, file_type):
+        """
+        Register freshly stored content in the blob store
+
+        If the same content is already stored, the new copy is deleted and
+        a reference to the existing blob is taken instead.
+
+        Returns:
+            dict: Blob document describing the stored content
+        """
+        while not Blob.create_blob(checksum, backend.name, storage_ref, file_size, file_type):
+            # The same content was stored concurrently, keep the other copy
+            blob = Blob.add_reference(checksum)
+            if blob:
+                self.delete_content(backend, storage_ref)
+                return blob
+
+        return Blob.get_blob(checksum)
+
+    def release_storage(self, file_record):
+        """
+        Release the stored content of a file record
+
+        Drops the record's blob reference and frees the content when it
+        was the last one. Safe to call more than once per record.
+
+        Returns:
+            bool: True if this call released the record's storage
+        """
+        if not File.mark_storage_released(file_record['_id']):
+            return False
+
+        if file_record.get('checksum') and self.release_blob(file_record['checksum']):
+            return True
+
+        if file_record.get('storage_ref') or 'gridfs_id' in file_record:
+            # Files stored before deduplication own their content
+            backend, storage_ref = self.get_storage_location(file_record)
+            self.delete_content(backend, storage_ref)
+
+        return True
+
+    def release_blob(self, checksum):
+        """
+        Drop one reference to a blob, freeing its content on the last one
+
+        Returns:
+            bool: False if no blob with this checksum exists
+        """
+        blob = Blob.release_reference(checksum)
+        if not blob:
+            return False
+
+        if blob['ref_count'] <= 0 and Blob.delete_unreferenced(checksum):
+            backend, storage_ref = self.get_storage_location(blob)
+            self.delete_content(backend, storage_ref)
+
+        return True
+
     def upload_file(self, file, uploader_id, expiration_hours=24, password=None, download_limit=None):
-        """Upload a file to GridFS and create database record"""
+        """Upload a file to storage and create database record"""
         try:
             # Validate file
             is_valid, message = self.validate_file(file)
             if not is_valid:
                 return False, message, None
             
-            # Read file content
-            file_content = file.read()
-            file.seek(0)  # Reset for potential re-reading
-            
             # Generate secure filename
             original_filename = secure_filename(file.filename)
-            unique_filename = self.generate_unique_filename(original_filename)
             
-            # Detect file type
-            file_type = self.detect_file_type(file_content)
+            # Store file content, reusing an existing blob for duplicates
+            blob = self.store_content(file.stream)
             
-            # Store file in GridFS
-            fs = self._get_fs()
-            file_id = fs.put(
-                file_content,
-                filename=unique_filename,
+            file_data = self.create_file_record(
+                blob=blob,
                 original_filename=original_filename,
-                content_type=file_type,
-                upload_date=datetime.utcnow(),
-                uploader_id=uploader_id
+                uploader_id=uploader_id,
+                expiration_hours=expiration_hours,
+                password=password,
+                download_limit=download_limit
             )
             
-            # Create file record in database
+            return True, "File uploaded successfully", file_data
+            
+        except Exception as e:
+            return False, f"Upload failed: {str(e)}", None
+    
+    def create_file_record(self, blob, original_filename, uploader_id, expiration_hours=24,
+                           password=None, download_limit=None, release_on_failure=True):
+        """
+        Create the database record of an uploaded file
+
+        Args:
+            blob: Blob document of the stored content
+            original_filename: Sanitized name of the uploaded file
+            release_on_failure: Drop the blob reference if the insert fails,
+                False when the caller keeps it to retry
+
+        Returns:
+            dict: Upload result sent back to the client
+        """
+        unique_filename = self.generate_unique_filename(original_filename)
+        
+        # Generate access token for public sharing
+        access_token = secrets.token_urlsafe(32)
+        
+        # Create the complete file record in a single insert
+        try:
             file_record_id = File.create_file(
                 filename=unique_filename,
                 original_filename=original_filename,
-                file_size=len(file_content),
-                file_type=file_type,
+                file_size=blob['file_size'],
+                file_type=blob['file_type'],
                 uploader_id=uploader_id,
                 expiration_hours=expiration_hours,
                 password=password,
-                download_limit=download_limit
+                download_limit=download_limit,
+                access_token=access_token,
+                checksum=blob['_id'],
+                storage_backend=blob['storage_backend'],
+                storage_ref=blob['storage_ref']
             )
-            
-            # Generate access token for public sharing
-            access_token = secrets.token_urlsafe(32)
-            db = self._get_db()
-            db.files.update_one(
-                {'_id': File.get_file_by_id(file_record_id)['_id']},
-                {'$set': {'access_token': access_token, 'gridfs_id': file_id}}
+        except Exception:
+            # Don't leave content behind that no record references
+            if release_on_failure:
+                self.release_blob(blob['_id'])
+            raise
+        
+        return {
+            'file_id': file_record_id,
+            'filename': unique_filename,
+            'original_filename': original_filename,
+            'file_size': blob['file_size'],
+            'file_type': blob['file_type'],
+            'access_token': access_token
+        }
+    
+    def download_file(self, file_id=None, password=None, count_download=True, access_token=None, resume=None):
+        """
+        Authorize a download and locate the file's content for streaming
+
+        Access checks and the download count are handled by a single
+        database operation. The returned StoredFile is opened lazily by
+        the response, so the file content is never loaded into memory as
+        a whole, except for popular small files held in the content cache.
+
+        Args:
+            file_id: ID of the file, or
+            access_token: Share token of the file
+            resume: (claim_id, range_start) of a request resuming a counted
+                download, or None
+
+        Returns:
+            tuple: (success, message, StoredFile, filename, file type, file record)
+        """
+        try:
+            file_record, message = File.claim_download(
+                file_id=file_id,
+                access_token=access_token,
+                password=password,
+                count_download=count_download,
+                resume=resume
             )
+            if not file_record:
+                return False, message, None, None, None, None
             
-            return True, "File uploaded successfully", {
-                'file_id': file_record_id,
-                'filename': unique_filename,
-                'original_filename': original_filename,
-                'file_size': len(file_content),
-                'file_type': file_type,
-                'access_token': access_token
-            }
+            # Locate file content, popular small files are served from memory
+            backend, storage_ref = self.get_storage_location(file_record)
+            stored_file = self.locate_content(backend, storage_ref, file_record['file_size'])
+            
+            return True, "File retrieved successfully", stored_file, file_record['original_filename'], \
+                file_record['file_type'], file_record
             
         except Exception as e:
-            return False, f"Upload failed: {str(e)}", None
+            return False, f"Download failed: {str(e)}", None, None, None, None
     
-    def download_file(self, file_id, password=None):
-        """Download a file from GridFS"""
+    def authorize_download(self, file_id=None, password=None, access_token=None):
+        """
+        Check that a file may be downloaded without counting a download
+
+        Used to answer conditional requests from metadata alone; nothing is
+        read from storage.
+
+        Returns:
+            tuple: (success, message, file record with the download fields)
+        """
         try:
-            # Check file access
-            can_access, message = File.check_file_access(file_id, password)
-            if not can_access:
-                return False, message, None, None, None
-            
-            # Get file record
-            file_record = File.get_file_by_id(file_id)
+            file_record, message = File.claim_download(
+                file_id=file_id,
+                access_token=access_token,
+                password=password,
+                count_download=False
+            )
             if not file_record:
-                return False, "File not found", None, None, None
-            
-            # Get file from GridFS
-            fs = self._get_fs()
-            gridfs_file = fs.get(file_record['gridfs_id'])
-            file_content = gridfs_file.read()
-            
-            # Update download count
-            File.update_download_count(file_id)
-            
-            return True, "File retrieved successfully", file_content, file_record['original_filename'], file_record['file_type']
-            
+                return False, message, None
+            return True, "File may be downloaded", file_record
         except Exception as e:
-            return False, f"Download failed: {str(e)}", None, None, None
+            return False, f"Download failed: {str(e)}", None
     
     def get_file_info(self, file_id):
         """Get file information without downloading"""
@@ -197,23 +419,36 @@ class FileService:
             if file_record['uploader_id'] != user_id:
                 return False, "Unauthorized: You can only delete your own files"
             
-            # Delete from GridFS
-            if 'gridfs_id' in file_record:
-                fs = self._get_fs()
-                fs.delete(file_record['gridfs_id'])
-            
-            # Deactivate file record
-            File.deactivate_file(file_id)
+            # Deactivate file record and drop its content reference
+            self.release_storage(file_record)
             
             return True, "File deleted successfully"
             
         except Exception as e:
             return False, f"Delete failed: {str(e)}"
     
-    def get_user_files(self, user_id, include_expired=False):
-        """Get all files for a user"""
+    # Fields fetched for the file list, matching what get_user_files returns
+    USER_FILES_PROJECTION = {
+        'original_filename': 1, 'file_size': 1, 'file_type': 1, 'upload_date': 1,
+        'expiration_date': 1, 'download_count': 1, 'download_limit': 1,
+        'is_active': 1, 'password': 1, 'access_token': 1
+    }
+    
+    def get_user_files(self, user_id, include_expired=False, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        Get a page of files for a user
+
+        Returns:
+            tuple: (success, message, files, cursor of the next page or None)
+        """
         try:
-            files = File.get_files_by_uploader(user_id, include_expired)
+            files, next_cursor = File.get_files_by_uploader(
+                user_id,
+                include_expired,
+                limit=limit,
+                cursor=cursor,
+                projection=self.USER_FILES_PROJECTION
+            )
             
             # Convert ObjectId to string and format data
             formatted_files = []
@@ -233,15 +468,32 @@ class FileService:
                 }
                 formatted_files.append(formatted_file)
             
-            return True, "Files retrieved successfully", formatted_files
+            return True, "Files retrieved successfully", formatted_files, next_cursor
             
+        except ValueError as e:
+            return False, str(e), None, None
         except Exception as e:
-            return False, f"Error retrieving files: {str(e)}", None
+            return False, f"Error retrieving files: {str(e)}", None, None
+    
+    def get_user_file_stats(self, user_id):
+        """
+        Get the totals of a user's active files, without listing them
+
+        Returns:
+            tuple: (success, message, stats)
+        """
+        try:
+            return True, "File stats retrieved successfully", File.get_uploader_stats(user_id)
+        except Exception as e:
+            return False, f"Error retrieving file stats: {str(e)}", None
     
     def cleanup_expired_files(self):
-        """Clean up expired files (to be run periodically)"""
+        """
+        Mark expired files as inactive
+
+        Their storage is released by ReclaimService, which runs this first.
+        """
         try:
-            # Mark expired files as inactive
             result = File.delete_expired_files()
             return True, f"Cleaned up {result.modified_count} expired files"
         except Exception as e:
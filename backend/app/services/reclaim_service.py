@@ -0,0 +1,169 @@
+"""
+Reclaim service for freeing the storage of expired, deleted and orphaned files.
+"""
+import time
+from datetime import timedelta
+from flask import current_app
+from app.utils.db import get_db
+from app.models.file import File
+from app.models.blob import Blob
+from app.models.upload_session import UploadSession
+from app.services.file_service import FileService
+from app.storage import GridFSStorage, get_storage
+
+
+class Throttle:
+    """Paces operations to at most `rate` per second (0 disables pacing)"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+
+    def wait(self):
+        """Block until the next operation is allowed"""
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + self.interval
+
+
+class ReclaimService:
+    """
+    Frees the storage held by files that can no longer be downloaded
+
+    Work happens in bounded batches with every storage delete paced by a
+    throttle, so a large backlog is worked off over several runs instead
+    of saturating MongoDB I/O in one go. Settings come from the app config:
+
+    RECLAIM_BATCH_SIZE: Records or storage entries handled per batch
+    RECLAIM_MAX_BATCHES: Batches per step in a single run
+    RECLAIM_DELETES_PER_SECOND: Pace of storage deletes (0 for unlimited)
+    ORPHAN_GRACE_HOURS: Minimum age of unreferenced content before it is
+        considered orphaned, covering uploads that are still being committed
+    """
+
+    def __init__(self, file_service=None):
+        self.file_service = file_service or FileService()
+
+    def run(self):
+        """Run every reclamation step (to be run periodically)"""
+        try:
+            config = current_app.config
+            throttle = Throttle(config['RECLAIM_DELETES_PER_SECOND'])
+            batch_size = config['RECLAIM_BATCH_SIZE']
+            max_batches = config['RECLAIM_MAX_BATCHES']
+            grace = timedelta(hours=config['ORPHAN_GRACE_HOURS'])
+            
+            success, message = self.file_service.cleanup_expired_files()
+            if not success:
+                return False, message, None
+            
+            stats = {
+                'released_files': self.release_inactive_files(throttle, batch_size, max_batches),
+                'freed_blobs': self.free_unreferenced_blobs(throttle, batch_size),
+                'orphaned_content': 0,
+                'orphaned_partials': 0
+            }
+            for backend_name in current_app.extensions['storage']['backends']:
+                backend = get_storage(backend_name)
+                stats['orphaned_content'] += self.sweep_orphaned_content(
+                    backend, throttle, batch_size, max_batches, grace
+                )
+                stats['orphaned_partials'] += self.sweep_orphaned_partials(
+                    backend, throttle, batch_size, max_batches, grace
+                )
+            
+            return True, (
+                f"{message}, released storage of {stats['released_files']} files, "
+                f"freed {stats['freed_blobs']} unreferenced blobs, "
+                f"removed {stats['orphaned_content']} orphaned and "
+                f"{stats['orphaned_partials']} partial uploads"
+            ), stats
+            
+        except Exception as e:
+            return False, f"Reclaim failed: {str(e)}", None
+
+    def release_inactive_files(self, throttle, batch_size, max_batches):
+        """Release the content references of expired and deleted files"""
+        released = 0
+        for _ in range(max_batches):
+            batch = list(File.get_unreleased_inactive_files(limit=batch_size))
+            for file_record in batch:
+                throttle.wait()
+                if self.file_service.release_storage(file_record):
+                    released += 1
+            
+            if len(batch) < batch_size:
+                break
+        
+        return released
+
+    def free_unreferenced_blobs(self, throttle, batch_size):
+        """Free blobs whose last reference was dropped without freeing them"""
+        freed = 0
+        for blob in Blob.get_unreferenced_blobs(limit=batch_size):
+            throttle.wait()
+            if Blob.delete_unreferenced(blob['_id']):
+                backend, storage_ref = self.file_service.get_storage_location(blob)
+                self.file_service.delete_content(backend, storage_ref)
+                freed += 1
+        
+        return freed
+
+    def sweep_orphaned_content(self, backend, throttle, batch_size, max_batches, grace):
+        """Delete stored content that neither a blob nor a legacy record references"""
+        def find_referenced(refs):
+            referenced = Blob.get_referenced_refs(backend.name, refs)
+            referenced |= UploadSession.get_committed_refs(backend.name, refs)
+            if backend.name == GridFSStorage.name:
+                referenced |= File.get_unreleased_gridfs_ids(refs)
+            return referenced
+        
+        return self._sweep(
+            f'orphan_sweep:{backend.name}', backend.list_refs, find_referenced,
+            lambda ref: self.file_service.delete_content(backend, ref), throttle, batch_size, max_batches, grace
+        )
+
+    def sweep_orphaned_partials(self, backend, throttle, batch_size, max_batches, grace):
+        """Delete partial upload content whose session is gone"""
+        def find_referenced(refs):
+            return UploadSession.get_session_refs(backend.name, refs)
+        
+        return self._sweep(
+            f'partial_sweep:{backend.name}', backend.list_partial_refs, find_referenced,
+            backend.discard_partial, throttle, batch_size, max_batches, grace
+        )
+
+    def _sweep(self, name, list_refs, find_referenced, delete, throttle, batch_size, max_batches, grace):
+        """
+        Page through a backend listing and delete unreferenced entries
+
+        The listing position is stored in the maintenance_state collection,
+        so consecutive runs cover the whole backend a few batches at a time.
+        """
+        db = get_db()
+        state = db.maintenance_state.find_one({'_id': name}) or {}
+        cursor = state.get('cursor')
+        deleted = 0
+        
+        for _ in range(max_batches):
+            refs, cursor = list_refs(after=cursor, min_age=grace, limit=batch_size)
+            if refs:
+                referenced = find_referenced(refs)
+                for ref in refs:
+                    if ref not in referenced:
+                        throttle.wait()
+                        delete(ref)
+                        deleted += 1
+            
+            if cursor is None:
+                break
+        
+        db.maintenance_state.update_one(
+            {'_id': name},
+            {'$set': {'cursor': cursor}},
+            upsert=True
+        )
+        return deleted
@@ -0,0 +1,239 @@
+"""
+Upload service for resumable chunked uploads.
+"""
+from werkzeug.utils import secure_filename
+from app.models.blob import Blob
+from app.models.upload_session import UploadSession
+from app.services.file_service import FileService
+from app.storage import HashingReader, get_storage
+
+
+class UploadService:
+    """
+    Resumable uploads modelled on the tus protocol
+
+    A client creates a session for a file of known size, appends chunks
+    at the current offset, queries the offset after a dropped connection
+    and finally completes the session. Chunks are appended straight into
+    partial storage and the file record is only created on completion.
+    """
+
+    def __init__(self, file_service=None):
+        self.file_service = file_service or FileService()
+
+    def _session_data(self, session_id, session):
+        """Format an upload session for the client"""
+        return {
+            'upload_id': str(session_id),
+            'original_filename': session['original_filename'],
+            'file_size': session['file_size'],
+            'offset': session['offset'],
+            'expires_at': session['expires_at']
+        }
+
+    def create_session(self, uploader_id, filename, file_size, expiration_hours=24,
+                       password=None, download_limit=None):
+        """Start a resumable upload of a file with a known size"""
+        try:
+            if not filename:
+                return False, "No file selected", None
+            
+            if not self.file_service.allowed_file(filename):
+                return False, f"File type not allowed. Allowed types: {', '.join(FileService.ALLOWED_EXTENSIONS)}", None
+            
+            if file_size < 0:
+                return False, "Invalid file size", None
+            
+            if file_size > FileService.MAX_FILE_SIZE:
+                return False, f"File too large. Maximum size: {FileService.MAX_FILE_SIZE / (1024*1024):.0f}MB", None
+            
+            original_filename = secure_filename(filename)
+            backend = get_storage()
+            storage_ref = backend.start_partial()
+            
+            session_id = UploadSession.create_session(
+                uploader_id=uploader_id,
+                original_filename=original_filename,
+                file_size=file_size,
+                storage_backend=backend.name,
+                storage_ref=storage_ref,
+                expiration_hours=expiration_hours,
+                password=password,
+                download_limit=download_limit
+            )
+            
+            session = UploadSession.get_session(session_id, uploader_id)
+            return True, "Upload session created", self._session_data(session_id, session)
+            
+        except Exception as e:
+            return False, f"Upload failed: {str(e)}", None
+
+    def get_status(self, session_id, uploader_id):
+        """Get the current offset of an upload session"""
+        session = UploadSession.get_session(session_id, uploader_id)
+        if not session:
+            return False, "Upload session not found", None
+        
+        return True, "Upload session retrieved", self._session_data(session_id, session)
+
+    def append_chunk(self, session_id, uploader_id, offset, stream, chunk_size):
+        """
+        Append a chunk to an upload session
+
+        Args:
+            offset: Offset the client believes the session is at
+            stream: Stream of the chunk content
+            chunk_size: Length of the chunk in bytes
+
+        Returns:
+            tuple: (success, message, session data)
+        """
+        try:
+            session = UploadSession.get_session(session_id, uploader_id)
+            if not session:
+                return False, "Upload session not found", None
+            
+            if offset != session['offset']:
+                return False, f"Upload offset mismatch, expected {session['offset']}", self._session_data(session_id, session)
+            
+            if offset + chunk_size > session['file_size']:
+                return False, "Chunk exceeds the declared file size", self._session_data(session_id, session)
+            
+            session = UploadSession.lock_session(session_id, uploader_id, offset)
+            if not session:
+                return False, "Upload offset mismatch, another chunk is being written", None
+            
+            # On failure the offset stays put and the client retries from it
+            new_offset = offset
+            try:
+                backend = get_storage(session['storage_backend'])
+                new_offset = backend.append_partial(session['storage_ref'], offset, stream)
+            finally:
+                UploadSession.unlock_session(session_id, new_offset)
+            
+            session['offset'] = new_offset
+            return True, "Chunk uploaded", self._session_data(session_id, session)
+            
+        except Exception as e:
+            return False, f"Upload failed: {str(e)}", None
+
+    def complete_session(self, session_id, uploader_id):
+        """
+        Turn a fully uploaded session into a file record
+
+        The session is deleted only once the file record exists. Progress
+        of each step is recorded on it, so a failed completion can be
+        retried and an abandoned one is cleaned up by the session purge.
+        """
+        try:
+            session = UploadSession.lock_session(session_id, uploader_id)
+            if not session:
+                return False, "Upload session not found or busy", None
+            
+            if session['offset'] != session['file_size']:
+                UploadSession.unlock_session(session_id)
+                return False, f"Upload incomplete, {session['offset']} of {session['file_size']} bytes received", None
+            
+            try:
+                blob = self._register_session_content(session_id, session)
+                # The session's blob reference passes to the file record
+                file_data = self.file_service.create_file_record(
+                    blob=blob,
+                    original_filename=session['original_filename'],
+                    uploader_id=uploader_id,
+                    expiration_hours=session['expiration_hours'],
+                    password=session['password'],
+                    download_limit=session['download_limit'],
+                    release_on_failure=False
+                )
+            except Exception:
+                UploadSession.unlock_session(session_id)
+                raise
+            
+            UploadSession.delete_session(session_id)
+            
+            return True, "File uploaded successfully", file_data
+            
+        except Exception as e:
+            return False, f"Upload failed: {str(e)}", None
+
+    def _register_session_content(self, session_id, session):
+        """
+        Commit a session's content and take a blob reference for it
+
+        Resumes from the last step an earlier attempt recorded.
+
+        Returns:
+            dict: Blob document of the session's content
+        """
+        if session.get('checksum'):
+            blob = Blob.get_blob(session['checksum'])
+            if blob:
+                return blob
+        
+        backend = get_storage(session['storage_backend'])
+        storage_ref = session.get('committed_ref')
+        if storage_ref is None:
+            storage_ref = backend.commit_partial(session['storage_ref'], session['file_size'])
+            UploadSession.record_commit(session_id, storage_ref)
+        
+        checksum, file_type = self._hash_content(backend, storage_ref)
+        blob = self.file_service.register_content(
+            backend, storage_ref, checksum, session['file_size'], file_type
+        )
+        UploadSession.record_blob(session_id, blob['_id'])
+        return blob
+
+    def _discard_session_content(self, session):
+        """Free whatever content a session holds, at any step of its completion"""
+        backend = get_storage(session['storage_backend'])
+        if session.get('checksum'):
+            self.file_service.release_blob(session['checksum'])
+        elif session.get('committed_ref'):
+            self.file_service.delete_content(backend, session['committed_ref'])
+        else:
+            backend.discard_partial(session['storage_ref'])
+
+    def _hash_content(self, backend, storage_ref):
+        """
+        Hash and sniff stored content by streaming it back
+
+        Returns:
+            tuple: (checksum, file_type)
+        """
+        with backend.open(storage_ref) as f:
+            reader = HashingReader(f, head_size=FileService.MIME_SNIFF_BYTES)
+            while reader.read(FileService.UPLOAD_CHUNK_SIZE):
+                pass
+        
+        return reader.hexdigest(), self.file_service.detect_file_type(reader.head)
+
+    def abort_session(self, session_id, uploader_id):
+        """Cancel an upload session and discard its content"""
+        try:
+            session = UploadSession.lock_session(session_id, uploader_id)
+            if not session:
+                return False, "Upload session not found or busy"
+            
+            self._discard_session_content(session)
+            UploadSession.delete_session(session_id)
+            
+            return True, "Upload session cancelled"
+            
+        except Exception as e:
+            return False, f"Cancel failed: {str(e)}"
+
+    def purge_abandoned_sessions(self):
+        """Discard sessions that have been idle for too long (to be run periodically)"""
+        try:
+            purged = 0
+            session = UploadSession.lock_abandoned_session()
+            while session:
+                self._discard_session_content(session)
+                UploadSession.delete_session(session['_id'])
+                purged += 1
+                session = UploadSession.lock_abandoned_session()
+            
+            return True, f"Purged {purged} abandoned upload sessions"
+        except Exception as e:
+            return False, f"Purge failed: {str(e)}"
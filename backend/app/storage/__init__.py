@@ -0,0 +1,84 @@
+"""
+Storage package initialization.
+"""
+import os
+from flask import current_app
+from .base import ContentSource, StorageBackend, StoredFile, HashingReader
+from .gridfs_backend import GridFSStorage
+from .local_backend import LocalStorage
+from .memory_cache import ContentCache, MemoryContent
+from .disk_cache import DiskCache, DiskContent
+
+__all__ = [
+    'ContentSource', 'StorageBackend', 'StoredFile', 'HashingReader', 'GridFSStorage', 'LocalStorage',
+    'ContentCache', 'MemoryContent', 'DiskCache', 'DiskContent', 'init_storage', 'get_storage',
+    'init_content_caches', 'get_content_cache'
+]
+
+
+def init_storage(app):
+    """
+    Set up the storage backends for an application
+
+    All backends are registered so content written under a previous
+    STORAGE_BACKEND setting stays readable. New content goes to the
+    configured backend.
+    """
+    backend_name = app.config['STORAGE_BACKEND']
+    local_path = app.config.get('LOCAL_STORAGE_PATH') or os.path.join(app.instance_path, 'storage')
+
+    backends = {
+        GridFSStorage.name: GridFSStorage(),
+        LocalStorage.name: LocalStorage(local_path)
+    }
+
+    if backend_name not in backends:
+        raise ValueError(f"Unknown storage backend: {backend_name}")
+
+    app.extensions['storage'] = {
+        'default': backend_name,
+        'backends': backends
+    }
+
+
+def get_storage(name=None):
+    """
+    Get a storage backend of the current application
+
+    Args:
+        name: Backend name, defaults to the configured backend
+
+    Returns:
+        StorageBackend: The backend instance
+    """
+    storage = current_app.extensions['storage']
+    return storage['backends'][name or storage['default']]
+
+
+def init_content_caches(app):
+    """
+    Set up the content caches of an application
+
+    The memory cache holds popular small files in each worker process,
+    the disk cache larger files from remote storage, shared by the
+    processes of a node. Files small enough for the memory cache don't go
+    to disk.
+    """
+    max_file_size = app.config['HOT_FILE_MAX_SIZE']
+    app.extensions['content_caches'] = {
+        'memory': ContentCache(app.config['HOT_FILE_CACHE_BYTES'], max_file_size, app.config['HOT_FILE_MIN_HITS']),
+        'disk': DiskCache(app.config['DISK_CACHE_PATH'], app.config['DISK_CACHE_MAX_BYTES'], max_file_size + 1)
+    }
+
+
+def get_content_cache(tier):
+    """
+    Get a content cache of the current application
+
+    Args:
+        tier: 'memory' or 'disk'
+
+    Returns:
+        ContentCache or DiskCache: The cache instance
+    """
+    return current_app.extensions['content_caches'][tier]
@@ -0,0 +1,156 @@
+"""
+Storage backend interface and shared helpers.
+"""
+import hashlib
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+# Block size used when copying streams into and out of storage
+COPY_CHUNK_SIZE = 255 * 1024
+
+# Location and size of stored content, as handed to the download routes
+StoredFile = namedtuple('StoredFile', ['backend', 'ref', 'length'])
+
+
+class ContentSource(ABC):
+    """
+    Read access to content addressed by a reference
+
+    Download responses only need this much, so cached copies of content
+    (see MemoryContent and DiskContent) can be served like stored content.
+    """
+
+    name = None
+
+    @abstractmethod
+    def open(self, ref):
+        """
+        Open stored content for reading
+
+        Returns:
+            Seekable file-like object
+        """
+
+    def local_path(self, ref):
+        """
+        Get a filesystem path for stored content
+
+        Returns:
+            str: Absolute path that can be served with sendfile, or None if
+            the backend does not keep content on the local filesystem
+        """
+        return None
+
+    def open_local(self, ref):
+        """
+        Open content kept on the local filesystem, for sendfile
+
+        Returns:
+            Open file object, or None if the content is not kept locally
+        """
+        path = self.local_path(ref)
+        return open(path, 'rb') if path else None
+
+
+class StorageBackend(ContentSource):
+    """
+    Interface for the stores that hold file content
+
+    Backends only deal with bytes addressed by an opaque reference.
+    Metadata, deduplication and reference counting stay in the files and
+    blobs collections. A backend missing any of the methods below fails
+    when it is instantiated.
+    """
+
+    @abstractmethod
+    def save(self, stream):
+        """
+        Copy a stream into storage
+
+        Returns:
+            Reference to the stored content
+        """
+
+    @abstractmethod
+    def delete(self, ref):
+        """Delete stored content, ignoring content that is already gone"""
+
+    @abstractmethod
+    def start_partial(self):
+        """
+        Create empty content that is filled by successive appends
+
+        Returns:
+            Reference to the partial content
+        """
+
+    @abstractmethod
+    def append_partial(self, ref, offset, stream):
+        """
+        Write a stream into partial content starting at offset
+
+        Anything previously written at or after offset is overwritten, so
+        a failed append can be retried from the last acknowledged offset.
+
+        Returns:
+            int: Offset after the written data
+        """
+
+    @abstractmethod
+    def commit_partial(self, ref, length):
+        """
+        Turn complete partial content into regular stored content
+
+        Returns:
+            Reference to the stored content
+        """
+
+    @abstractmethod
+    def discard_partial(self, ref):
+        """Delete partial content, ignoring content that is already gone"""
+
+    @abstractmethod
+    def list_refs(self, after=None, min_age=None, limit=100):
+        """
+        List stored content in a stable order, for orphan sweeps
+
+        Args:
+            after: Continue after this reference
+            min_age: Only list content older than this timedelta
+            limit: Maximum number of entries to scan
+
+        Returns:
+            tuple: (references, cursor to continue from, or None when done)
+        """
+
+    @abstractmethod
+    def list_partial_refs(self, after=None, min_age=None, limit=100):
+        """
+        List uncommitted partial content, like list_refs
+
+        Returns:
+            tuple: (references, cursor to continue from, or None when done)
+        """
+
+
+class HashingReader:
+    """File-like wrapper that hashes and counts the bytes read through it"""
+
+    def __init__(self, stream, head_size=2048):
+        self._stream = stream
+        self._hasher = hashlib.sha256()
+        self._head_size = head_size
+        self.head = b''
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        if len(self.head) < self._head_size:
+            self.head += data[:self._head_size - len(self.head)]
+        self._hasher.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        """SHA-256 hex digest of everything read so far"""
+        return self._hasher.hexdigest()
@@ -0,0 +1,302 @@
+"""
+Local disk cache of large file content kept in remote storage.
+"""
+import os
+import time
+import uuid
+import fcntl
+import shutil
+import struct
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from .base import ContentSource, COPY_CHUNK_SIZE
+
+# Concurrent cache fills per worker process; more are skipped, not queued
+FILL_WORKERS = 2
+# Age after which a fill lock is considered left behind by a dead process
+STALE_LOCK_SECONDS = 15 * 60
+# Fraction of max_bytes an eviction frees the cache down to, so the
+# directory is not scanned again on the next fill
+EVICT_TO = 0.9
+# File in the cache root holding the total size of the cached files
+SIZE_FILE = 'size'
+SIZE = struct.Struct('<q')
+
+
+class DiskContent(ContentSource):
+    """
+    Read-only backend view of one cached file, already open
+
+    The file is opened when it is looked up, so an eviction before the
+    response is sent only unlinks it; the open handle keeps reading.
+    """
+
+    name = 'disk_cache'
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+
+    def open(self, ref):
+        return self.file_obj
+
+    def open_local(self, ref):
+        return self.file_obj
+
+
+class DiskCache:
+    """
+    Read-through cache of stored content on a local disk, e.g. an SSD
+
+    The first download of a file copies it into the cache in the
+    background while the download itself is streamed from storage as
+    usual; later downloads are sent from the cached file. Copies are
+    written to a temporary name and renamed into place, and a lock file
+    ensures only one process copies a given file. The directory is shared
+    by all worker processes of a node.
+
+    The total size of the cached files is kept in a small file in the
+    cache root, updated under a lock as files are added and removed. Once
+    it grows past max_bytes, least recently used files are evicted down
+    to EVICT_TO of the budget; hits refresh a file's modification time
+    for that. Only evictions scan the directory, and they recount the
+    total, correcting any drift.
+    """
+
+    def __init__(self, root, max_bytes, min_file_size):
+        self.root = os.path.abspath(root) if root else None
+        self.max_bytes = max_bytes
+        self.min_file_size = min_file_size
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.fill_failures = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return bool(self.root) and self.max_bytes > 0
+
+    def _path(self, key):
+        """Get the cache path for a (backend, reference) key"""
+        digest = hashlib.sha256(f'{key[0]}:{key[1]}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def open(self, key):
+        """
+        Open cached content, marking it as recently used
+
+        Returns:
+            File object of the cached content, or None if it is not cached
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+            cached = open(path, 'rb')
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return cached
+
+    def fill_async(self, key, backend, storage_ref, length):
+        """Copy content into the cache in the background, if there is room to"""
+        if not self.enabled or length < self.min_file_size or length > self.max_bytes:
+            return
+
+        with self._lock:
+            if self._pending >= FILL_WORKERS:
+                return
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=FILL_WORKERS, thread_name_prefix='disk-cache-fill')
+                self._pid = os.getpid()
+            self._pending += 1
+
+        self._executor.submit(self._fill, key, backend, storage_ref, current_app.logger)
+
+    def _fill(self, key, backend, storage_ref, logger):
+        path = self._path(key)
+        lock_path = f'{path}.lock'
+        temp_path = f'{path}.{uuid.uuid4().hex}.part'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not self._take_lock(lock_path):
+                return
+            try:
+                if os.path.exists(path):
+                    return
+                with backend.open(storage_ref) as source, open(temp_path, 'wb') as target:
+                    shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+                    size = target.tell()
+                os.replace(temp_path, path)
+                with self._lock:
+                    self.fills += 1
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                os.remove(lock_path)
+
+            total = self._add_size(size)
+            if total is None or total > self.max_bytes:
+                self.evict()
+        except Exception:
+            with self._lock:
+                self.fill_failures += 1
+            logger.exception("Disk cache fill failed")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _take_lock(self, lock_path):
+        """Create a fill lock file, taking over locks of crashed fills"""
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) < STALE_LOCK_SECONDS:
+                        return False
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def _open_size_file(self):
+        """Open the size file, locked against other processes"""
+        fd = os.open(os.path.join(self.root, SIZE_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _read_size(self, fd):
+        data = os.pread(fd, SIZE.size, 0)
+        return SIZE.unpack(data)[0] if len(data) == SIZE.size else None
+
+    def _write_size(self, fd, total):
+        os.pwrite(fd, SIZE.pack(max(0, total)), 0)
+
+    def _add_size(self, delta):
+        """
+        Add to the total size of the cache
+
+        Returns:
+            int: New total, or None if the total is unknown until the next eviction
+        """
+        fd = self._open_size_file()
+        try:
+            total = self._read_size(fd)
+            if total is not None:
+                total += delta
+                self._write_size(fd, total)
+            return total
+        finally:
+            os.close(fd)
+
+    def evict(self):
+        """Delete least recently used files until the cache fits its budget"""
+        fd = self._open_size_file()
+        try:
+            # Another process may have evicted while this one waited
+            total = self._read_size(fd)
+            if total is not None and total <= self.max_bytes:
+                return
+
+            entries, total = self._scan()
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if not self._remove(path):
+                        continue
+                    total -= size
+                    with self._lock:
+                        self.evictions += 1
+                    if total <= self.max_bytes * EVICT_TO:
+                        break
+            self._write_size(fd, total)
+        finally:
+            os.close(fd)
+
+    def _scan(self):
+        """
+        List the cached files, removing copies left behind by dead fills
+
+        Returns:
+            tuple: ([(mtime, size, path)], total size)
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith('.part'):
+                    # Left behind by a process that died while filling
+                    if now - stat.st_mtime > STALE_LOCK_SECONDS:
+                        self._remove(entry.path)
+                    continue
+                if entry.name.endswith('.lock'):
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        return entries, total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def invalidate(self, key):
+        """
+        Drop cached content, e.g. when it is deleted from storage
+
+        Only the copy of this node is removed. Copies on other nodes stay
+        until they are evicted; no file record references the deleted
+        content anymore, so they are never served.
+        """
+        if not self.enabled:
+            return
+
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        if self._remove(path):
+            self._add_size(-size)
+
+    def stats(self):
+        """Return a snapshot of the cache counters of this process"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'max_bytes': self.max_bytes,
+                'min_file_size': self.min_file_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'fills': self.fills,
+                'fill_failures': self.fill_failures,
+                'pending_fills': self._pending,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,133 @@
+"""
+GridFS storage backend.
+"""
+from datetime import datetime
+import gridfs
+from bson import Binary, ObjectId
+from gridfs.grid_file import DEFAULT_CHUNK_SIZE
+from app.utils.db import get_db
+from app.storage.base import StorageBackend, COPY_CHUNK_SIZE
+
+
+class GridFSStorage(StorageBackend):
+    """
+    Stores file content as GridFS files in the application database
+
+    Partial content is written as raw fs.chunks documents and only gets
+    its fs.files document on commit, which is the same layout GridFS
+    itself produces.
+    """
+
+    name = 'gridfs'
+
+    def _get_fs(self):
+        """Get a fresh GridFS connection"""
+        return gridfs.GridFS(get_db())
+
+    def save(self, stream):
+        grid_in = self._get_fs().new_file()
+
+        try:
+            block = stream.read(COPY_CHUNK_SIZE)
+            while block:
+                grid_in.write(block)
+                block = stream.read(COPY_CHUNK_SIZE)
+            grid_in.close()
+        except Exception:
+            # Drop any chunks already written for this file
+            grid_in.abort()
+            raise
+
+        return grid_in._id
+
+    def open(self, ref):
+        return self._get_fs().get(ref)
+
+    def delete(self, ref):
+        self._get_fs().delete(ref)
+
+    def start_partial(self):
+        return ObjectId()
+
+    def append_partial(self, ref, offset, stream):
+        chunks = get_db().fs.chunks
+        n, used = divmod(offset, DEFAULT_CHUNK_SIZE)
+
+        # Complete the trailing partial chunk of the previous append
+        buffer = b''
+        if used:
+            tail = chunks.find_one({'files_id': ref, 'n': n})
+            buffer = bytes(tail['data'])[:used]
+
+        written = 0
+        while True:
+            block = stream.read(DEFAULT_CHUNK_SIZE - len(buffer))
+            if not block:
+                break
+            buffer += block
+            written += len(block)
+            if len(buffer) == DEFAULT_CHUNK_SIZE:
+                self._write_chunk(chunks, ref, n, buffer)
+                n += 1
+                buffer = b''
+
+        if buffer and written:
+            self._write_chunk(chunks, ref, n, buffer)
+
+        return offset + written
+
+    def _write_chunk(self, chunks, ref, n, data):
+        """Insert or overwrite chunk n of a file"""
+        chunks.replace_one(
+            {'files_id': ref, 'n': n},
+            {'files_id': ref, 'n': n, 'data': Binary(data)},
+            upsert=True
+        )
+
+    def commit_partial(self, ref, length):
+        db = get_db()
+        # Drop chunks beyond the final length left by an overwritten append
+        last_chunk = (length - 1) // DEFAULT_CHUNK_SIZE if length else -1
+        db.fs.chunks.delete_many({'files_id': ref, 'n': {'$gt': last_chunk}})
+        db.fs.files.insert_one({
+            '_id': ref,
+            'length': length,
+            'chunkSize': DEFAULT_CHUNK_SIZE,
+            'uploadDate': datetime.utcnow()
+        })
+        return ref
+
+    def discard_partial(self, ref):
+        get_db().fs.chunks.delete_many({'files_id': ref})
+
+    def list_refs(self, after=None, min_age=None, limit=100):
+        query = {}
+        if after is not None:
+            query['_id'] = {'$gt': after}
+        if min_age is not None:
+            query['uploadDate'] = {'$lt': datetime.utcnow() - min_age}
+
+        files = get_db().fs.files.find(query, {'_id': 1}).sort('_id', 1).limit(limit)
+        refs = [f['_id'] for f in files]
+        return refs, refs[-1] if len(refs) == limit else None
+
+    def list_partial_refs(self, after=None, min_age=None, limit=100):
+        db = get_db()
+        # Partial references are ObjectIds created when the upload started
+        files_id = {}
+        if after is not None:
+            files_id['$gt'] = after
+        if min_age is not None:
+            files_id['$lt'] = ObjectId.from_datetime(datetime.utcnow() - min_age)
+
+        query = {'n': 0}
+        if files_id:
+            query['files_id'] = files_id
+
+        chunks = db.fs.chunks.find(query, {'files_id': 1}).sort('files_id', 1).limit(limit)
+        scanned = [c['files_id'] for c in chunks]
+
+        # Chunks of committed content have an fs.files document
+        committed = {f['_id'] for f in db.fs.files.find({'_id': {'$in': scanned}}, {'_id': 1})}
+        refs = [ref for ref in scanned if ref not in committed]
+        return refs, scanned[-1] if len(scanned) == limit else None
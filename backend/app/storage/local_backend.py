@@ -0,0 +1,143 @@
+"""
+Local filesystem storage backend.
+"""
+import os
+import time
+import uuid
+import shutil
+from app.storage.base import StorageBackend, COPY_CHUNK_SIZE
+
+
+class LocalStorage(StorageBackend):
+    """
+    Stores file content as plain files in a sharded directory tree
+
+    Content lives at <root>/ab/cd/abcd..., so no directory grows beyond a
+    few hundred entries. Serving a real path lets werkzeug hand the file
+    to the WSGI server's sendfile support. Partial content is kept under
+    <root>/partial until it is committed.
+    """
+
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, ref):
+        """Get the path for a reference"""
+        return os.path.join(self.root, ref[:2], ref[2:4], ref)
+
+    def save(self, stream):
+        ref = uuid.uuid4().hex
+        path = self._path(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary name so readers never see partial content
+        temp_path = f"{path}.part"
+        try:
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return ref
+
+    def _partial_path(self, ref):
+        """Get the path for a partial content reference"""
+        return os.path.join(self.root, 'partial', ref)
+
+    def open(self, ref):
+        return open(self._path(ref), 'rb')
+
+    def delete(self, ref):
+        try:
+            os.remove(self._path(ref))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, ref):
+        return self._path(ref)
+
+    def start_partial(self):
+        ref = uuid.uuid4().hex
+        path = self._partial_path(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+        return ref
+
+    def append_partial(self, ref, offset, stream):
+        with open(self._partial_path(ref), 'r+b') as f:
+            f.seek(offset)
+            f.truncate()
+            shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE)
+            return f.tell()
+
+    def commit_partial(self, ref, length):
+        path = self._path(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self._partial_path(ref), path)
+        return ref
+
+    def discard_partial(self, ref):
+        try:
+            os.remove(self._partial_path(ref))
+        except FileNotFoundError:
+            pass
+
+    def _is_old_enough(self, path, min_age):
+        """Check whether a file was last modified more than min_age ago"""
+        if min_age is None:
+            return True
+        try:
+            return os.path.getmtime(path) < time.time() - min_age.total_seconds()
+        except FileNotFoundError:
+            return False
+
+    def _sorted_entries(self, path):
+        """List a directory in sorted order, treating a missing one as empty"""
+        try:
+            return sorted(os.listdir(path))
+        except FileNotFoundError:
+            return []
+
+    def list_refs(self, after=None, min_age=None, limit=100):
+        refs = []
+        scanned = 0
+
+        for first in self._sorted_entries(self.root):
+            # Skips the partial directory and anything else not a shard
+            if len(first) != 2 or (after and first < after[:2]):
+                continue
+            for second in self._sorted_entries(os.path.join(self.root, first)):
+                if after and first + second < after[:4]:
+                    continue
+                shard = os.path.join(self.root, first, second)
+                for name in self._sorted_entries(shard):
+                    if name.endswith('.part') or (after and name <= after):
+                        continue
+                    if self._is_old_enough(os.path.join(shard, name), min_age):
+                        refs.append(name)
+                    scanned += 1
+                    if scanned == limit:
+                        return refs, name
+
+        return refs, None
+
+    def list_partial_refs(self, after=None, min_age=None, limit=100):
+        partial_root = os.path.join(self.root, 'partial')
+        refs = []
+        scanned = 0
+
+        for name in self._sorted_entries(partial_root):
+            if after and name <= after:
+                continue
+            if self._is_old_enough(os.path.join(partial_root, name), min_age):
+                refs.append(name)
+            scanned += 1
+            if scanned == limit:
+                return refs, name
+
+        return refs, None
@@ -0,0 +1,129 @@
+"""
+In-memory cache of small, frequently downloaded file content.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from .base import ContentSource
+
+# Files seen but not yet admitted whose access counts are tracked
+ADMISSION_CANDIDATES = 4096
+
+
+class MemoryContent(ContentSource):
+    """Read-only backend view of cached bytes, so they can be served like stored content"""
+
+    name = 'memory'
+
+    def __init__(self, data):
+        self.data = data
+
+    def open(self, ref):
+        return io.BytesIO(self.data)
+
+
+class ContentCache:
+    """
+    Size-bounded LRU cache of stored content, keyed by (backend, reference)
+
+    Content only gets in once it was requested min_hits times and is at
+    most max_file_size bytes, so one-off downloads and large files never
+    push out the popular ones. Stored content never changes under a
+    reference, so entries only need to be dropped when the content is
+    deleted; access to expired or deleted files is refused before the
+    cache is consulted.
+    """
+
+    def __init__(self, max_bytes, max_file_size, min_hits):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.min_hits = min_hits
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._candidates = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.admissions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 and self.max_file_size > 0
+
+    def get(self, key):
+        """Return cached content, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return data
+
+    def should_admit(self, key, length):
+        """
+        Record a miss and decide whether the content should now be cached
+
+        Returns:
+            bool: True if the caller should load the content and put() it
+        """
+        if not self.enabled or length > self.max_file_size:
+            return False
+
+        with self._lock:
+            count = self._candidates.pop(key, 0) + 1
+            if count >= self.min_hits:
+                return True
+            self._candidates[key] = count
+            while len(self._candidates) > ADMISSION_CANDIDATES:
+                self._candidates.popitem(last=False)
+            return False
+
+    def put(self, key, data):
+        """Cache content, evicting the least recently used entries to fit it"""
+        if not self.enabled or len(data) > self.max_file_size:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self.size += len(data)
+            self.admissions += 1
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop content, e.g. when it is deleted from storage"""
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self.size -= len(data)
+            self._candidates.pop(key, None)
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_bytes': self.max_bytes,
+                'max_file_size': self.max_file_size,
+                'min_hits': self.min_hits,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'admissions': self.admissions,
+                'evictions': self.evictions
+            }
@@ -2,10 +2,16 @@
 JWT utility functions for authentication
 """
 import os
+import time
+import uuid
+import hashlib
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify, current_app
+from app.utils.cache import TTLCache
+from app.utils.revocation import revocation_list
+from app.utils.metrics import registry
 
 # Get JWT secret key from environment or use a default for development
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'dev_secret_key')
@@ -13,6 +19,12 @@ JWT_ALGORITHM = 'HS256'
 JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
 JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
 
+# Verified token payloads by token digest, kept until the token expires
+JWT_CACHE_ENABLED = os.environ.get('JWT_CACHE_ENABLED', 'true').lower() == 'true'
+JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', 4096))
+
+token_cache = TTLCache(JWT_CACHE_SIZE if JWT_CACHE_ENABLED else 0, JWT_ACCESS_TOKEN_EXPIRES.total_seconds())
+
 def generate_token(user_id, token_type="access", expires_delta=None):
     """
     Generate a JWT token for a user
@@ -31,6 +43,7 @@ def generate_token(user_id, token_type="access", expires_delta=None):
     payload = {
         "user_id": str(user_id),
         "type": token_type,
+        "jti": uuid.uuid4().hex,
         "exp": datetime.utcnow() + expires_delta,
         "iat": datetime.utcnow()
     }
@@ -46,15 +59,46 @@ def decode_token(token):
         token: JWT token to decode
         
     Returns:
-        dict: Decoded token payload or None if invalid
+        dict: Decoded token payload or None if invalid or revoked
     """
+    if JWT_CACHE_ENABLED:
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        payload = token_cache.get(key)
+        if payload is not None:
+            if payload['exp'] > time.time() and not is_revoked(payload):
+                return dict(payload)
+            token_cache.delete(key)
+            return None
+    
+    started = time.perf_counter()
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    finally:
+        registry.observe('jwt_decode_duration_seconds', time.perf_counter() - started)
+    
+    if is_revoked(payload):
+        return None
+    
+    # Only cache tokens that can expire, so the cache never outlives them
+    if JWT_CACHE_ENABLED and isinstance(payload.get('exp'), (int, float)):
+        ttl = payload['exp'] - time.time()
+        if ttl > 0:
+            token_cache.set(key, dict(payload), ttl=ttl)
+    
+    return payload
+
+def is_revoked(payload):
+    """
+    Check if a decoded token was revoked, without a database query
+    
+    Tokens issued before token IDs were introduced can't be revoked.
+    """
+    jti = payload.get("jti")
+    return bool(jti) and revocation_list.is_revoked(jti)
 
 def get_token_from_header():
     """
@@ -0,0 +1,138 @@
+"""
+In-process caches shared by the request threads of a worker
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from app.utils.db import get_db
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after a fixed time
+
+    Thread-safe. Counts hits, misses and evictions for the admin stats.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._reset()
+        # Forked workers start empty and with a fresh lock
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value of a key, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Cache a value, evicting the least recently used entries if full"""
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove a key from the cache"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions
+            }
+
+
+class VersionStamp:
+    """
+    Cross-process invalidation signal stored in MongoDB
+
+    Writers bump a counter in the cache_versions collection after changing
+    cached data. Readers compare it with the version they last saw, at
+    most once per check interval, and drop their cache when it moved. A
+    worker can therefore serve data changed by another worker for up to
+    one check interval.
+    """
+
+    def __init__(self, name, cache, check_interval):
+        self.name = name
+        self.cache = cache
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def bump(self):
+        """Signal every process that the cached data changed"""
+        self.cache.clear()
+        try:
+            stamp = get_db().cache_versions.find_one_and_update(
+                {'_id': self.name},
+                {'$inc': {'version': 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except PyMongoError:
+            # Other processes find out when their entries expire
+            return
+        with self._lock:
+            self._version = stamp['version']
+            self._checked_at = time.monotonic()
+
+    def check(self):
+        """Clear the cache if another process bumped the version"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+
+        try:
+            stamp = get_db().cache_versions.find_one({'_id': self.name})
+        except PyMongoError:
+            self.cache.clear()
+            return
+
+        version = stamp['version'] if stamp else 0
+        with self._lock:
+            if version != self._version:
+                self.cache.clear()
+                self._version = version
+            self._checked_at = now
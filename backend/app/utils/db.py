@@ -2,38 +2,205 @@
 Database utility functions for MongoDB connection
 """
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import time
+import threading
+from pymongo import MongoClient, monitoring
+from app.utils.metrics import command_metrics
 
 # MongoDB connection string from environment variable or default
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://mongo:27017/')
 DB_NAME = os.environ.get('DB_NAME', 'secure_share')
 
-# Client instance shared across the app
+# Connection pool tuning, see the MongoClient documentation for details
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 0)) or None  # 0 means no timeout
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+# Comma separated list, e.g. "zstd,snappy,zlib" (zstd and snappy need extra packages)
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Collects connection pool statistics from pymongo pool events
+
+    Checkout events are published on the thread doing the checkout, so
+    the wait time is measured with a thread-local start timestamp.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all statistics"""
+        with self._lock:
+            self.connections = 0
+            self.checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def _end_wait(self):
+        started = getattr(self._local, 'checkout_started', None)
+        self._local.checkout_started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._end_wait()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def connection_check_out_failed(self, event):
+        wait = self._end_wait()
+        with self._lock:
+            self.checkout_failures += 1
+            self.total_wait += wait
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self):
+        """Get a snapshot of the pool statistics"""
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'checked_out': self.checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_wait_ms': round(self.total_wait * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3)
+            }
+
+
+class HeartbeatMonitor(monitoring.ServerHeartbeatListener):
+    """Tracks the outcome of pymongo's background server heartbeats"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clear all heartbeat state"""
+        self.servers = {}
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.servers[event.connection_id] = {
+            'ok': True,
+            'rtt_ms': round(event.duration * 1000, 3),
+            'last_heartbeat': time.time(),
+            'error': None
+        }
+
+    def failed(self, event):
+        self.servers[event.connection_id] = {
+            'ok': False,
+            'rtt_ms': None,
+            'last_heartbeat': time.time(),
+            'error': str(event.reply)
+        }
+
+
+pool_monitor = PoolMonitor()
+heartbeat_monitor = HeartbeatMonitor()
+
+# Client instance shared across the app, one per process
 _mongo_client = None
+_mongo_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """
+    Forget the parent's client in a forked child (e.g. a gunicorn worker)
+
+    A MongoClient is not fork-safe, so the child lazily creates its own.
+    The parent's client is only dropped, closing it would affect sockets
+    the parent still uses.
+    """
+    global _mongo_client, _mongo_client_pid, _client_lock
+    _mongo_client = None
+    _mongo_client_pid = None
+    _client_lock = threading.Lock()
+    pool_monitor.reset()
+    heartbeat_monitor.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _client_options():
+    """Keyword arguments for MongoClient built from the pool settings"""
+    options = {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'socketTimeoutMS': MONGO_SOCKET_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'event_listeners': [pool_monitor, heartbeat_monitor, command_metrics],
+        # Don't start monitor threads until first use, so a client created
+        # before a fork never has threads the child would lose
+        'connect': False
+    }
+    if MONGO_COMPRESSORS:
+        options['compressors'] = MONGO_COMPRESSORS
+    return options
+
 
 def get_mongo_client():
     """
-    Returns a singleton instance of the MongoDB client
+    Returns the MongoDB client of the current process
+
+    The client is created on first use and reused afterwards. Server
+    health is tracked by pymongo's background monitoring instead of
+    pinging on every call.
     """
-    global _mongo_client
-    if _mongo_client is None:
-        try:
-            _mongo_client = MongoClient(MONGO_URI)
-            # Ping the server to check if connection is established
-            _mongo_client.admin.command('ping')
-            print("Connected successfully to MongoDB")
-        except ConnectionFailure as e:
-            print(f"Could not connect to MongoDB: {e}")
-            raise
-    
-    # Check if the connection is still alive
-    try:
-        _mongo_client.admin.command('ping')
-    except Exception as e:
-        print(f"MongoDB connection lost, reconnecting: {e}")
-        _mongo_client = None
-        return get_mongo_client()
+    global _mongo_client, _mongo_client_pid
+    pid = os.getpid()
+    if _mongo_client is None or _mongo_client_pid != pid:
+        with _client_lock:
+            if _mongo_client is None or _mongo_client_pid != pid:
+                _mongo_client = MongoClient(MONGO_URI, **_client_options())
+                _mongo_client_pid = pid
     
     return _mongo_client
 
@@ -44,12 +211,36 @@ def get_db():
     client = get_mongo_client()
     return client[DB_NAME]
 
+def get_mongo_health():
+    """
+    Returns the MongoDB health as seen by pymongo's server monitoring
+
+    The state comes from the latest background heartbeats. Only a process
+    that has not used its client yet sends a ping, which starts the
+    monitoring threads.
+    """
+    client = get_mongo_client()
+    if not heartbeat_monitor.servers:
+        try:
+            client.admin.command('ping')
+        except Exception:
+            pass
+
+    topology = client.topology_description
+    return {
+        'writable': topology.has_writable_server(),
+        'readable': topology.has_readable_server(),
+        'topology': topology.topology_type_name,
+        'servers': {f"{host}:{port}": state for (host, port), state in heartbeat_monitor.servers.items()},
+        'pool': pool_monitor.stats()
+    }
+
 def close_mongo_connection():
     """
     Closes the MongoDB connection
     """
     global _mongo_client
-    if _mongo_client:
+    if _mongo_client and _mongo_client_pid == os.getpid():
         _mongo_client.close()
         _mongo_client = None
         print("MongoDB connection closed")
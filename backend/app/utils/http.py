@@ -0,0 +1,256 @@
+"""
+HTTP helpers for streaming file responses
+"""
+import calendar
+from datetime import datetime, timezone
+from flask import current_app, request, send_file, jsonify
+from itsdangerous import URLSafeTimedSerializer, BadData
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.wsgi import FileWrapper
+
+# Read size used when streaming a file to the client
+STREAM_BUFFER_SIZE = 255 * 1024
+# Longest time a browser may reuse a download without revalidating it
+MAX_DOWNLOAD_CACHE_AGE = 24 * 60 * 60
+# Header carrying the token that lets a counted download be resumed for free
+RESUME_TOKEN_HEADER = 'X-Resume-Token'
+# Time during which a counted download may be resumed without counting again,
+# matching the lifetime of the resume claim recorded on the file
+RESUME_TOKEN_MAX_AGE = 60 * 60
+
+
+def download_etag(file_record):
+    """
+    Strong ETag of a file's content, from its metadata alone
+
+    Content is identified by its SHA-256 checksum, or by its storage
+    reference for files stored before checksums were recorded.
+    """
+    content_id = file_record.get('checksum') or file_record.get('storage_ref') or file_record.get('gridfs_id')
+    return f"{content_id}-{calendar.timegm(file_record['upload_date'].utctimetuple())}"
+
+
+def download_cache_control(file_record):
+    """
+    Cache-Control value for a download
+
+    Downloads of files with a download limit must reach the server to be
+    counted, so they always revalidate. Other downloads may be reused
+    until the file expires.
+    """
+    if file_record.get('download_limit'):
+        return 'private, no-cache'
+
+    remaining = (file_record['expiration_date'] - datetime.utcnow()).total_seconds()
+    return f'private, max-age={max(0, min(int(remaining), MAX_DOWNLOAD_CACHE_AGE))}'
+
+
+def is_not_modified(file_record, if_none_match, if_modified_since):
+    """
+    Check conditional request headers against a file's metadata
+
+    Args:
+        file_record: File record with the download projection
+        if_none_match: Parsed If-None-Match header (werkzeug ETags)
+        if_modified_since: Parsed If-Modified-Since header (aware datetime) or None
+
+    Returns:
+        bool: True if a 304 Not Modified answers the request
+    """
+    # If-None-Match takes precedence when both are sent
+    if if_none_match:
+        return if_none_match.contains_weak(download_etag(file_record))
+
+    if if_modified_since:
+        uploaded = file_record['upload_date'].replace(microsecond=0, tzinfo=timezone.utc)
+        return uploaded <= if_modified_since
+
+    return False
+
+
+def is_conditional_download():
+    """Check whether the current request may be answered with 304"""
+    return request.method in ('GET', 'HEAD') and (
+        'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+    )
+
+
+def set_download_validators(response, file_record):
+    """Add ETag, Last-Modified and Cache-Control of a download to a response"""
+    response.set_etag(download_etag(file_record))
+    response.last_modified = file_record['upload_date']
+    response.headers['Cache-Control'] = download_cache_control(file_record)
+    return response
+
+
+def not_modified(file_record):
+    """
+    Build a 304 Not Modified response for a download
+
+    Returns:
+        Response: Empty 304 response carrying the download validators
+    """
+    return set_download_validators(current_app.response_class(status=304), file_record)
+
+
+def send_revalidated_json(payload):
+    """
+    Send JSON that clients must revalidate, answering 304 when unchanged
+
+    The ETag is computed from the serialized payload, which is built from
+    metadata only, so revalidations skip the response body.
+    """
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def is_new_download():
+    """
+    Check whether the current request counts as a download
+
+    Every request that sends content counts, whatever its Range header
+    says, so a file's download limit cannot be bypassed with ranges.
+    Resumes carrying a resume token are handled by get_resume_claim.
+
+    Returns:
+        bool: True if the request should count as a download
+    """
+    return request.method != 'HEAD'
+
+
+def _resume_serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='download-resume')
+
+
+def issue_resume_token(download_key, claim_id):
+    """
+    Sign a token letting the client resume a counted download
+
+    Args:
+        download_key: File ID or share token the download was requested with
+        claim_id: Resume claim recorded on the file by the download
+
+    Returns:
+        str: Token for the X-Resume-Token header of later Range requests
+    """
+    return _resume_serializer().dumps([download_key, claim_id])
+
+
+def get_resume_claim(download_key):
+    """
+    Get the resume claim presented by the current request, if any
+
+    Only GET requests for a single range starting inside the file, past
+    its first byte, qualify, and they must carry a valid X-Resume-Token
+    header (or resume query argument) issued for the same file within
+    RESUME_TOKEN_MAX_AGE. The claim itself is checked, and consumed, by
+    File.claim_download; the token alone proves nothing.
+
+    Returns:
+        tuple: (claim_id, range_start), or None if the request is no resume
+    """
+    if request.method != 'GET' or not request.range or len(request.range.ranges) != 1:
+        return None
+
+    range_start = request.range.ranges[0][0]
+    if range_start <= 0:
+        return None
+
+    token = request.headers.get(RESUME_TOKEN_HEADER) or request.args.get('resume')
+    if not token:
+        return None
+
+    try:
+        token_key, claim_id = _resume_serializer().loads(token, max_age=RESUME_TOKEN_MAX_AGE)
+    except (BadData, TypeError, ValueError):
+        return None
+    return (claim_id, range_start) if token_key == download_key else None
+
+
+def set_resume_token(response, download_key, file_record):
+    """Attach a token for the resume claim of a download to its response"""
+    claim_id = file_record.get('resume_claim')
+    if claim_id and response.status_code in (200, 206):
+        response.headers[RESUME_TOKEN_HEADER] = issue_resume_token(download_key, claim_id)
+    return response
+
+
+def send_stream(file_obj, length, download_name, mimetype, file_record=None):
+    """
+    Stream a seekable file object as an attachment
+
+    Range requests are answered with 206 Partial Content by seeking the
+    file object to the first requested byte, so nothing before it is read.
+
+    Args:
+        file_obj: Seekable file-like object (e.g. a GridOut)
+        length: Total size of the file in bytes
+        download_name: Filename sent in Content-Disposition
+        mimetype: MIME type of the file
+        file_record: (optional) File record providing the cache validators
+
+    Returns:
+        Response: Streaming (200/206) or 416 response
+    """
+    # Use werkzeug's wrapper rather than wsgi.file_wrapper so Range
+    # requests can seek instead of reading and discarding leading bytes
+    response = current_app.response_class(
+        FileWrapper(file_obj, STREAM_BUFFER_SIZE),
+        mimetype=mimetype,
+        direct_passthrough=True
+    )
+    response.content_length = length
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if file_record:
+        # Also lets If-Range requests resume against the same content
+        set_download_validators(response, file_record)
+
+    try:
+        return response.make_conditional(
+            request.environ,
+            accept_ranges=True,
+            complete_length=length
+        )
+    except RequestedRangeNotSatisfiable as e:
+        file_obj.close()
+        return e.get_response(request.environ)
+
+
+def send_stored_file(stored_file, download_name, mimetype, file_record=None):
+    """
+    Send stored content as an attachment
+
+    Content the backend keeps on the local filesystem is sent from an open
+    file, so full downloads can use the WSGI server's sendfile support.
+    Range requests are streamed instead, seeking directly to the requested
+    offset. Other backends are always streamed.
+
+    Args:
+        stored_file: StoredFile locating the content
+        download_name: Filename sent in Content-Disposition
+        mimetype: MIME type of the file
+        file_record: (optional) File record providing the cache validators
+
+    Returns:
+        Response: File response
+    """
+    backend, storage_ref, length = stored_file
+    local_file = backend.open_local(storage_ref) if 'Range' not in request.headers else None
+
+    if local_file:
+        response = send_file(
+            local_file,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            etag=download_etag(file_record) if file_record else False,
+            last_modified=file_record['upload_date'] if file_record else None
+        )
+        response.content_length = length
+        if file_record:
+            response.headers['Cache-Control'] = download_cache_control(file_record)
+        return response
+
+    return send_stream(backend.open(storage_ref), length, download_name, mimetype, file_record)
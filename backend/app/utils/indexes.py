@@ -0,0 +1,165 @@
+"""
+MongoDB index registry and maintenance helpers
+"""
+import re
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.utils.db import get_db
+
+# Every index the application relies on, by collection
+INDEXES = {
+    'users': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+        # Admin user list pages
+        IndexModel([('created_at', ASCENDING), ('_id', ASCENDING)], name='created_at_id'),
+    ],
+    'files': [
+        # Share links; records from failed uploads may lack a token
+        IndexModel(
+            [('access_token', ASCENDING)],
+            name='access_token_unique',
+            unique=True,
+            partialFilterExpression={'access_token': {'$type': 'string'}}
+        ),
+        # My files pages: equality on uploader and state, sorted by date and _id
+        IndexModel(
+            [('uploader_id', ASCENDING), ('is_active', ASCENDING),
+             ('upload_date', DESCENDING), ('_id', DESCENDING)],
+            name='uploader_active_upload_date_id'
+        ),
+        # My files pages including expired ones
+        IndexModel(
+            [('uploader_id', ASCENDING), ('upload_date', DESCENDING), ('_id', DESCENDING)],
+            name='uploader_upload_date_id'
+        ),
+        # Expiry cleanup and storage release
+        IndexModel(
+            [('is_active', ASCENDING), ('expiration_date', ASCENDING)],
+            name='active_expiration_date'
+        ),
+        IndexModel(
+            [('is_active', ASCENDING), ('storage_released', ASCENDING)],
+            name='active_storage_released'
+        ),
+        # Orphan sweep lookups of records stored before deduplication
+        IndexModel([('gridfs_id', ASCENDING)], name='gridfs_id', sparse=True),
+        # Purges records some time after their content was released
+        IndexModel([('purge_at', ASCENDING)], name='purge_at_ttl', expireAfterSeconds=0),
+    ],
+    'blobs': [
+        IndexModel([('storage_backend', ASCENDING), ('storage_ref', ASCENDING)], name='storage_location'),
+        IndexModel([('ref_count', ASCENDING)], name='ref_count'),
+    ],
+    'upload_sessions': [
+        IndexModel([('expires_at', ASCENDING)], name='expires_at'),
+        IndexModel([('storage_backend', ASCENDING), ('storage_ref', ASCENDING)], name='storage_location'),
+        # Orphan sweeps skip content committed by a session still being completed
+        IndexModel(
+            [('storage_backend', ASCENDING), ('committed_ref', ASCENDING)],
+            name='committed_location',
+            partialFilterExpression={'committed_ref': {'$exists': True}}
+        ),
+    ],
+    'revoked_tokens': [
+        # Incremental revocation list sync
+        IndexModel([('revoked_at', ASCENDING)], name='revoked_at'),
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+    # Shared rate limit buckets, dropped once idle for a full period
+    'rate_limits': [
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+    # The indexes GridFS creates itself, so they exist before the first write
+    'fs.files': [
+        IndexModel([('filename', ASCENDING), ('uploadDate', ASCENDING)], name='filename_1_uploadDate_1'),
+    ],
+    'fs.chunks': [
+        IndexModel([('files_id', ASCENDING), ('n', ASCENDING)], name='files_id_1_n_1', unique=True),
+    ],
+}
+
+
+def ensure_indexes(db=None):
+    """
+    Create every registered index that does not exist yet
+
+    Creating an index that already exists is a no-op, so this is safe to
+    run on every start.
+
+    Returns:
+        dict: Created index names per collection, or the error message for
+        collections whose indexes could not be created
+    """
+    db = db if db is not None else get_db()
+    results = {}
+
+    for collection_name, indexes in INDEXES.items():
+        try:
+            results[collection_name] = db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # E.g. duplicate values preventing a unique index
+            results[collection_name] = f"failed: {e}"
+
+    return results
+
+
+def get_index_builds(db=None):
+    """
+    Get index builds currently running on the database
+
+    Requires the inprog privilege; returns an empty list without it.
+
+    Returns:
+        list: Dicts with collection, index names and progress message
+    """
+    db = db if db is not None else get_db()
+    try:
+        operations = db.client.admin.aggregate([
+            {'$currentOp': {'allUsers': True, 'idleConnections': False}},
+            {'$match': {'command.createIndexes': {'$exists': True}, 'ns': {'$regex': f'^{re.escape(db.name)}\\.'}}}
+        ])
+    except OperationFailure:
+        return []
+
+    builds = []
+    for operation in operations:
+        progress = operation.get('progress', {})
+        builds.append({
+            'collection': operation['command']['createIndexes'],
+            'indexes': [index.get('name') for index in operation['command'].get('indexes', [])],
+            'progress': f"{progress.get('done', 0)}/{progress.get('total', '?')}" if progress else operation.get('msg', 'running')
+        })
+    return builds
+
+
+def get_index_usage(db=None):
+    """
+    Get usage statistics for every index of the registered collections
+
+    Usage counters are kept per mongod since its last restart, so an index
+    reported as unused may just not have been needed since then.
+
+    Returns:
+        list: Dicts with collection, index name, ops count, tracking start
+        and whether the index is in the registry
+    """
+    db = db if db is not None else get_db()
+    usage = []
+
+    for collection_name, indexes in INDEXES.items():
+        registered = {index.document['name'] for index in indexes}
+        try:
+            stats = db[collection_name].aggregate([{'$indexStats': {}}])
+            for stat in stats:
+                usage.append({
+                    'collection': collection_name,
+                    'index': stat['name'],
+                    'ops': stat['accesses']['ops'],
+                    'since': stat['accesses']['since'],
+                    'registered': stat['name'] in registered or stat['name'] == '_id_'
+                })
+        except OperationFailure:
+            continue
+
+    return usage
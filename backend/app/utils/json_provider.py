@@ -0,0 +1,99 @@
+"""
+JSON provider serializing API responses with orjson when it is installed
+"""
+import uuid
+import decimal
+import dataclasses
+from datetime import date, datetime, timezone
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
+
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _http_date(dt):
+    """werkzeug's http_date, several times faster for the UTC datetimes MongoDB returns"""
+    if type(dt) is not datetime or (dt.tzinfo is not None and dt.tzinfo is not timezone.utc):
+        return http_date(dt)
+    return (f'{_WEEKDAYS[dt.weekday()]}, {dt.day:02d} {_MONTHS[dt.month - 1]} {dt.year:04d} '
+            f'{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} GMT')
+
+
+def _default(o):
+    """
+    Serialize types JSON doesn't know, the same way Flask does
+
+    Dates keep Flask's HTTP date format ("Wed, 21 Oct 2015 07:28:00 GMT"),
+    so clients see the same values with either encoder. ObjectIds, which
+    Flask can't serialize, become their hex string.
+    """
+    if isinstance(o, date):
+        return _http_date(o)
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson, falling back to the stdlib
+
+    Compact output is the same as Flask's default provider, except that
+    non-ASCII characters are written as UTF-8 instead of \\u escapes.
+    Pretty-printed output (debug mode) and anything orjson can't encode,
+    like integers beyond 64 bits, go through the stdlib encoder.
+    """
+
+    default = staticmethod(_default)
+
+    def __init__(self, app, use_orjson=True):
+        super().__init__(app)
+        self.use_orjson = use_orjson and orjson is not None
+
+    def _orjson_dumps(self, obj):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson and not kwargs:
+            try:
+                return self._orjson_dumps(obj).decode('utf-8')
+            except orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass  # Let the stdlib raise its usual error
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if not self.use_orjson or pretty:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = self._orjson_dumps(obj) + b'\n'
+        except orjson.JSONEncodeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
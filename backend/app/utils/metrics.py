@@ -0,0 +1,349 @@
+"""
+Request, MongoDB and authentication metrics in Prometheus text format
+
+Every process records into its own in-memory registry and writes a
+snapshot to <METRICS_DIR>/metrics-<pid>.json every few seconds. The
+/metrics endpoint sums the snapshots of all processes, so any gunicorn
+worker answers for the whole node. Totals of processes that have exited
+are merged into a persistent file rather than dropped, so counters never
+go backwards.
+"""
+import os
+import re
+import json
+import time
+import fcntl
+import hmac
+import bisect
+import atexit
+import ipaddress
+import threading
+import bson
+from flask import g, request, jsonify
+from pymongo import monitoring
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds between snapshot writes of a process
+FLUSH_INTERVAL = 5
+# Snapshot file of a live process, and of the summed totals of exited ones
+SNAPSHOT_NAME = re.compile(r'^metrics-(\d+)\.json$')
+EXITED_SNAPSHOT = 'metrics-exited.json'
+# Measuring a reply means encoding it again, which costs more than the
+# rest of the metrics put together on GridFS chunk reads, so it is opt-in
+MONGO_COMMAND_BYTES = os.environ.get('METRICS_MONGO_BYTES', 'false').lower() == 'true'
+
+# name: (type, help, label names)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status')),
+    'http_request_duration_seconds': (
+        'histogram', 'Time to build the response, by endpoint', ('endpoint',)),
+    'mongo_commands_total': (
+        'counter', 'MongoDB commands by collection, command and outcome', ('collection', 'command', 'outcome')),
+    'mongo_command_duration_seconds': (
+        'histogram', 'MongoDB command round-trip time', ('collection', 'command')),
+    'mongo_command_reply_bytes_total': (
+        'counter', 'BSON size of MongoDB command replies', ('collection', 'command')),
+    'password_hash_duration_seconds': (
+        'histogram', 'bcrypt hash and check time, including pool queueing', ('operation',)),
+    'password_hash_rejections_total': (
+        'counter', 'Password hash requests rejected by admission control', ()),
+    'jwt_decode_duration_seconds': (
+        'histogram', 'JWT signature verification time, cache misses only', ()),
+}
+
+
+class Registry:
+    """
+    Counters and histograms of one process
+
+    Recording is a dict lookup and an addition under a lock, so it costs
+    a microsecond or two.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.dirty = False
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.dirty = True
+
+    def observe(self, name, seconds, labels=()):
+        key = (name, labels)
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Bucket counts (the last one is +Inf), then sum
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+            self.dirty = True
+
+    def snapshot(self):
+        with self._lock:
+            self.dirty = False
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()]
+            }
+
+
+registry = Registry()
+
+
+class MetricsWriter:
+    """Writes the snapshots of this process for the /metrics endpoint"""
+
+    def __init__(self):
+        self.directory = None
+        self.logger = None
+        self._pid = None
+
+    def start(self, directory, logger):
+        """Write snapshots to a directory from a background thread of this process"""
+        self.directory = directory
+        self.logger = logger
+        os.makedirs(directory, exist_ok=True)
+        self.ensure_thread()
+        # Leave the last counts of this process for the exited totals
+        atexit.register(self.flush)
+
+    def ensure_thread(self):
+        """Start the writer thread of the current process if needed"""
+        if self.directory and self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='metrics-writer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if registry.dirty:
+                self.flush()
+
+    def flush(self):
+        """Write the snapshot of this process, replacing the previous one"""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        try:
+            self._write(path, registry.snapshot())
+        except OSError as e:
+            self.logger.warning("Could not write metrics snapshot: %s", e)
+
+    def _write(self, path, snapshot):
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+
+    def collect(self):
+        """
+        Sum the snapshots of every process of the node
+
+        Snapshots of exited processes are folded into the exited totals
+        under a lock shared by all processes, so each is counted exactly
+        once.
+        """
+        self.flush()
+        counters, histograms = {}, {}
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = self._read(os.path.join(self.directory, EXITED_SNAPSHOT))
+            if exited:
+                _merge(counters, histograms, exited)
+
+            for name in os.listdir(self.directory):
+                match = SNAPSHOT_NAME.match(name)
+                if not match:
+                    continue
+                path = os.path.join(self.directory, name)
+                snapshot = self._read(path)
+                if not snapshot:
+                    continue
+                _merge(counters, histograms, snapshot)
+                if not _process_alive(int(match.group(1))):
+                    exited = _merge_snapshot(exited, snapshot)
+                    self._write(os.path.join(self.directory, EXITED_SNAPSHOT), exited)
+                    os.remove(path)
+
+        return counters, histograms
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+writer = MetricsWriter()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(counters, histograms, snapshot):
+    """Add a snapshot into counter and histogram dicts keyed by (name, labels)"""
+    for name, labels, value in snapshot['counters']:
+        key = (name, tuple(labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in snapshot['histograms']:
+        key = (name, tuple(labels))
+        total = histograms.setdefault(key, [0] * len(values))
+        for i, value in enumerate(values):
+            total[i] += value
+
+
+def _merge_snapshot(total, snapshot):
+    """Add a snapshot to another, in the snapshot file format"""
+    counters, histograms = {}, {}
+    for part in (total, snapshot):
+        if part:
+            _merge(counters, histograms, part)
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()]
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render_metrics():
+    """Render the node-wide metrics in Prometheus text format"""
+    counters, histograms = writer.collect()
+    lines = []
+    for name, (metric_type, help_text, label_names) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(label_names, labels)} {value}')
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(label_names, labels, ("le", bound))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(label_names, labels)} {values[-1]}')
+                lines.append(f'{name}_count{_format_labels(label_names, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Records the duration and reply size of every MongoDB command"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome):
+        collection = self._pending.pop((event.connection_id, event.request_id), '')
+        labels = (collection, event.command_name)
+        registry.observe('mongo_command_duration_seconds', event.duration_micros / 1e6, labels)
+        registry.inc('mongo_commands_total', labels + (outcome,))
+        return labels
+
+    def succeeded(self, event):
+        labels = self._finish(event, 'ok')
+        if MONGO_COMMAND_BYTES:
+            registry.inc('mongo_command_reply_bytes_total', labels, len(bson.encode(event.reply)))
+
+    def failed(self, event):
+        self._finish(event, 'error')
+
+
+command_metrics = CommandMetrics()
+
+
+def init_metrics(app):
+    """
+    Time every request of the app and expose /metrics
+
+    /metrics reveals traffic per endpoint and collection names, so it only
+    answers scrapers sending METRICS_TOKEN as a bearer token, or connecting
+    from METRICS_ALLOWED_IPS (addresses or networks, loopback by default).
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    writer.start(app.config['METRICS_DIR'] or os.path.join(app.instance_path, 'metrics'), app.logger)
+
+    @app.before_request
+    def start_timer():
+        # Workers forked from a preloading master start their own writer
+        writer.ensure_thread()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            registry.observe('http_request_duration_seconds', time.perf_counter() - started, (endpoint,))
+            registry.inc('http_requests_total', (endpoint, request.method, str(response.status_code)))
+        return response
+
+    token = app.config['METRICS_TOKEN']
+    allowed_networks = [
+        ipaddress.ip_network(network.strip(), strict=False)
+        for network in app.config['METRICS_ALLOWED_IPS'].split(',') if network.strip()
+    ]
+
+    @app.route('/metrics')
+    def metrics():
+        if not _may_scrape(token, allowed_networks):
+            return jsonify({"error": "Not allowed to read metrics"}), 403
+        return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def _may_scrape(token, allowed_networks):
+    """Check the scraper's bearer token, or failing that its address"""
+    auth_header = request.headers.get('Authorization', '')
+    if token and auth_header.startswith('Bearer '):
+        return hmac.compare_digest(auth_header[7:].encode('utf-8'), token.encode('utf-8'))
+
+    try:
+        address = ipaddress.ip_address(request.remote_addr)
+    except ValueError:
+        return False
+    return any(address in network for network in allowed_networks)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry._reset)
@@ -0,0 +1,76 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+import json
+import base64
+from datetime import datetime
+from bson import ObjectId
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """
+    Parse a requested page size, clamped to 1..MAX_PAGE_SIZE
+
+    Raises:
+        ValueError: If the value is not an integer
+    """
+    if value in (None, ''):
+        return default
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+
+def encode_cursor(sort_value, last_id):
+    """Encode the position after a document as an opaque continuation token"""
+    payload = json.dumps({'v': sort_value.isoformat(), 'i': str(last_id)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a continuation token
+
+    Returns:
+        tuple: (sort value, last _id)
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(payload['v']), ObjectId(payload['i'])
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+def keyset_condition(sort_field, direction, cursor):
+    """
+    Build the query condition for documents after a cursor
+
+    Documents are ordered by (sort_field, _id), so the condition is
+    answered from the index no matter how deep the page is.
+    """
+    sort_value, last_id = decode_cursor(cursor)
+    op = '$lt' if direction == DESCENDING else '$gt'
+    return {'$or': [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, '_id': {op: last_id}}
+    ]}
+
+
+def split_page(documents, limit, sort_field):
+    """
+    Trim a page fetched with limit + 1 documents
+
+    Returns:
+        tuple: (documents of the page, cursor of the next page or None)
+    """
+    if len(documents) <= limit:
+        return documents, None
+    
+    page = documents[:limit]
+    return page, encode_cursor(page[-1][sort_field], page[-1]['_id'])
@@ -0,0 +1,176 @@
+"""
+Password hashing on a bounded worker pool
+
+bcrypt is deliberately slow and holds the CPU for its whole run. Running
+it in request threads lets a burst of logins starve downloads and other
+cheap requests, so hashes are computed in a separate process pool with
+a fixed number of workers. Requests beyond the workers and a short queue
+are rejected at once instead of piling up.
+"""
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from app.utils.metrics import registry
+
+# Hashing processes per application process, 0 hashes in the request thread
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+# Hash requests allowed to wait for a free worker before new ones are rejected
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 16))
+# Seconds to wait for a result before giving up on it
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+# bcrypt cost factor for new hashes, older hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when a hash request can not be admitted or finished in time"""
+
+    retry_after = 1
+
+
+def _hashpw(password, rounds):
+    """Hash a password with a new salt, runs in a pool process"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed):
+    """Check a password against a hash, runs in a pool process"""
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt calls on a process pool with admission control
+
+    At most workers + queue_size calls are in flight at any time. The
+    pool is created on first use and re-created after a fork, so it is
+    never shared between application processes.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE_SIZE,
+                 timeout=PASSWORD_HASH_TIMEOUT, rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.rounds = rounds
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + self.queue_size)
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Spawned workers don't inherit the threads and sockets of
+                # the application process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            registry.inc('password_hash_rejections_total')
+            raise PasswordHasherBusy("Too many password checks in progress, please retry shortly")
+
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                try:
+                    result = func(*args)
+                finally:
+                    self._release_slot()
+            else:
+                try:
+                    future = self._get_executor().submit(func, *args)
+                except Exception:
+                    self._release_slot()
+                    raise
+                # The slot is held until the worker is done, even if the
+                # caller stops waiting, so timeouts can't oversubscribe it
+                future.add_done_callback(self._release_slot)
+                try:
+                    result = future.result(timeout=self.timeout)
+                except FutureTimeoutError:
+                    future.cancel()
+                    with self._lock:
+                        self.timeouts += 1
+                    raise PasswordHasherBusy("Password check timed out, please retry shortly")
+        except PasswordHasherBusy:
+            raise
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            registry.observe('password_hash_duration_seconds', time.perf_counter() - started, (func.__name__.strip('_'),))
+
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def _release_slot(self, future=None):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def hash(self, password):
+        """Return the bcrypt hash of a password"""
+        return self._run(_hashpw, password, self.rounds)
+
+    def check(self, password, hashed):
+        """Return whether a password matches a bcrypt hash"""
+        return self._run(_checkpw, password, hashed)
+
+    def needs_rehash(self, hashed):
+        """Return whether a bcrypt hash was made with a different cost factor"""
+        try:
+            # Hashes look like $2b$<rounds>$<salt and digest>
+            return int(hashed.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return False
+
+    def stats(self):
+        """Return a snapshot of the hasher counters"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'rounds': self.rounds,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts
+            }
+
+    def shutdown(self):
+        """Stop the worker processes of this application process"""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+# A forked child must not submit work to its parent's pool
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=password_hasher._reset)
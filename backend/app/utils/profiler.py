@@ -0,0 +1,214 @@
+"""
+On-demand request profiling
+
+A request is profiled when an admin sends the X-Profile header, or at
+random with PROFILE_SAMPLE_RATE. Results are written to the profile
+directory as pstats files (cProfile) or collapsed stacks (sampling),
+named after the endpoint and duration, for download through the admin
+routes. Requests that are not profiled only pay for a header lookup.
+
+Profiling ends when the response is built, before its body is sent, so
+the streaming of a download body is not part of its profile.
+"""
+import os
+import re
+import sys
+import time
+import random
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_MODES = ('cprofile', 'sampling')
+# Profile file names: <timestamp>-<endpoint>-<duration>ms.<ext>
+PROFILE_NAME = re.compile(r'^(?P<created>\d{8}T\d{6}\d{6})-(?P<endpoint>[\w.]+)-(?P<duration>\d+)ms\.(?:prof|txt)$')
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval
+
+    Produces collapsed stacks ("outer;inner;leaf count" lines), the input
+    format of flame graph tools. Cheaper than cProfile on deep call trees
+    and unbiased by function call counts.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class ProfileStore:
+    """Profile files in a directory, keeping only the most recent ones"""
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+
+    def path_for(self, endpoint, duration, extension):
+        created = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        endpoint = re.sub(r'[^\w.]', '_', endpoint or 'unmatched')
+        return os.path.join(self.directory, f'{created}-{endpoint}-{int(duration * 1000)}ms.{extension}')
+
+    def list_profiles(self):
+        """
+        List stored profiles, newest first
+
+        Returns:
+            list: Dicts with name, endpoint, duration_ms, created_at and size
+        """
+        profiles = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return profiles
+
+        for entry in entries:
+            match = PROFILE_NAME.match(entry.name)
+            if not match:
+                continue
+            profiles.append({
+                'name': entry.name,
+                'endpoint': match.group('endpoint'),
+                'duration_ms': int(match.group('duration')),
+                'created_at': datetime.strptime(match.group('created'), '%Y%m%dT%H%M%S%f'),
+                'format': 'pstats' if entry.name.endswith('.prof') else 'collapsed',
+                'size': entry.stat().st_size
+            })
+
+        profiles.sort(key=lambda profile: profile['name'], reverse=True)
+        return profiles
+
+    def get_path(self, name):
+        """Get the path of a stored profile, or None for unknown names"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def prune(self):
+        """Delete profiles beyond the newest `keep`"""
+        for profile in self.list_profiles()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, profile['name']))
+            except FileNotFoundError:
+                pass
+
+
+def _requested_mode(app):
+    """Profiling mode asked for by the current request, or None"""
+    header = request.headers.get(PROFILE_HEADER)
+    if header is not None:
+        mode = header.lower() if header.lower() in PROFILE_MODES else app.config['PROFILE_MODE']
+        return mode if _is_admin_request() else None
+
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        return app.config['PROFILE_MODE']
+    return None
+
+
+def _is_admin_request():
+    """Check if the request carries a valid access token of an admin"""
+    from app.models import User
+    from app.utils.auth import get_token_from_header, decode_token
+
+    token = get_token_from_header()
+    payload = decode_token(token) if token else None
+    if not payload or payload.get('type') != 'access':
+        return False
+    user = User.find_by_id(payload.get('user_id'))
+    return bool(user and user.is_admin)
+
+
+def init_profiler(app):
+    """Register the profiling hooks and the profile store of the app"""
+    store = ProfileStore(
+        app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles'),
+        app.config['PROFILE_KEEP']
+    )
+    app.extensions['profiles'] = store
+    if not app.config['PROFILER_ENABLED']:
+        return store
+
+    @app.before_request
+    def start_profile():
+        mode = _requested_mode(app)
+        if mode is None:
+            return
+
+        if mode == 'sampling':
+            profiler = StackSampler(threading.get_ident(), app.config['PROFILE_SAMPLING_INTERVAL'])
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        g.profile = (mode, profiler, time.perf_counter())
+
+    def finish_profile():
+        """Stop the profiler of the request and save its results"""
+        profile = g.pop('profile', None)
+        if profile is None:
+            return None
+
+        mode, profiler, started = profile
+        if mode == 'sampling':
+            profiler.stop()
+        else:
+            profiler.disable()
+        duration = time.perf_counter() - started
+
+        try:
+            os.makedirs(store.directory, exist_ok=True)
+            if mode == 'sampling':
+                profiler.dump(store.path_for(request.endpoint, duration, 'txt'))
+            else:
+                profiler.dump_stats(store.path_for(request.endpoint, duration, 'prof'))
+            store.prune()
+        except OSError as e:
+            app.logger.warning("Could not save request profile: %s", e)
+        return duration
+
+    @app.after_request
+    def save_profile(response):
+        duration = finish_profile()
+        if duration is not None:
+            response.headers['X-Profile-Duration-Ms'] = str(int(duration * 1000))
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # after_request is skipped when a view raises, the profiler must
+        # not keep running on this thread
+        finish_profile()
+
+    return store
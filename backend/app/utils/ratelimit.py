@@ -0,0 +1,269 @@
+"""
+Token bucket rate limiting for abuse-prone endpoints
+
+Each rule gives a key (client IP, user or access token) a bucket of
+`limit` requests refilled evenly over `period` seconds. Buckets live in
+a memory-mapped file shared by every worker process of a node, or in
+MongoDB when several nodes must enforce one budget.
+"""
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+from flask import request, jsonify
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from app.utils.db import get_db
+from app.utils.auth import get_token_from_header, decode_token
+from app.utils.http import get_resume_claim
+
+# Slot layout: key hash, tokens left, time of the last update
+SLOT = struct.Struct('<Qdd')
+# Neighbouring slots probed before a key takes over the stalest one
+PROBES = 4
+
+
+class SharedMemoryBuckets:
+    """
+    Fixed-size hash table of token buckets in a shared memory-mapped file
+
+    Slots are locked with POSIX byte-range locks against other processes
+    and with a thread lock within this process, so a decision costs a few
+    microseconds. When every probed slot is taken, the key evicts the one
+    updated longest ago; this can only make a limit more lenient.
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._fd = None
+        self._map = None
+        self._pid = None
+
+    def _open(self):
+        if self._map is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = self.slots * SLOT.size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+        return self._map
+
+    def take(self, key, limit, period):
+        """
+        Take a token from the bucket of a key
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        rate = limit / period
+        start = key_hash % self.slots
+
+        with self._lock:
+            buckets = self._open()
+            # Lock the probed slots; runs at the end of the table wrap to slot 0
+            regions = [(start, min(PROBES, self.slots - start))]
+            if start + PROBES > self.slots:
+                regions.append((0, start + PROBES - self.slots))
+            for first, count in regions:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, count * SLOT.size, first * SLOT.size)
+            try:
+                now = time.time()
+                slot, stalest, stalest_time = None, None, None
+                for probe in range(PROBES):
+                    index = (start + probe) % self.slots
+                    slot_hash, tokens, updated = SLOT.unpack_from(buckets, index * SLOT.size)
+                    if slot_hash == key_hash:
+                        slot = index
+                        break
+                    if stalest is None or updated < stalest_time:
+                        stalest, stalest_time = index, updated
+
+                if slot is None:
+                    slot, tokens, updated = stalest, float(limit), now
+
+                tokens = min(float(limit), tokens + (now - updated) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(buckets, slot * SLOT.size, key_hash, tokens, now)
+            finally:
+                for first, count in regions:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, count * SLOT.size, first * SLOT.size)
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class MongoBuckets:
+    """
+    Token buckets in the rate_limits collection, shared by every node
+
+    Each decision is a single atomic update using the server clock.
+    Buckets left untouched for a full period are removed by a TTL index.
+    """
+
+    def take(self, key, limit, period):
+        """
+        Take a token from the bucket of a key
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        rate = limit / period
+        elapsed = {'$divide': [{'$subtract': ['$$NOW', {'$ifNull': ['$updated_at', '$$NOW']}]}, 1000]}
+        refilled = {'$min': [limit, {'$add': [{'$ifNull': ['$tokens', limit]}, {'$multiply': [elapsed, rate]}]}]}
+
+        bucket = get_db().rate_limits.find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {'tokens': refilled, 'updated_at': '$$NOW'}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {
+                    'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']},
+                    'expires_at': {'$add': ['$$NOW', period * 1000]}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket['allowed']:
+            return True, 0
+        return False, (1 - bucket['tokens']) / rate
+
+
+class RateLimiter:
+    """Applies the configured per-endpoint rules to incoming requests"""
+
+    def __init__(self, rules, buckets):
+        self.rules = rules
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    def rule_key(self, endpoint, rule, remote_addr, access_token=None, user_id=None, resume_claim=None):
+        """
+        Bucket key of a request under a rule
+
+        Resumes of a counted download get a bucket of their own claim, so
+        clients resuming large files are not throttled by their earlier
+        requests. Each resume is given a new claim, only replays of one
+        share a bucket.
+        """
+        if resume_claim:
+            subject = f'resume:{resume_claim}'
+        elif rule.get('key') == 'token' and access_token:
+            subject = f'token:{access_token}'
+        elif rule.get('key') == 'user' and user_id:
+            subject = f'user:{user_id}'
+        else:
+            subject = f'ip:{remote_addr}'
+        return f'{endpoint}:{subject}'
+
+    def hit(self, endpoint, remote_addr, access_token=None, user_id=None, resume_claim=None):
+        """
+        Count a request against the rule of an endpoint
+
+        Returns:
+            tuple: (allowed, seconds until a request would be allowed)
+        """
+        rule = self.rules.get(endpoint)
+        if not rule:
+            return True, 0
+
+        key = self.rule_key(endpoint, rule, remote_addr, access_token, user_id, resume_claim)
+        try:
+            allowed, retry_after = self.buckets.take(key, rule['limit'], rule['period'])
+        except (OSError, PyMongoError):
+            # Never turn a limiter failure into an outage
+            with self._lock:
+                self.errors += 1
+            return True, 0
+
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return allowed, retry_after
+
+    def stats(self):
+        """Return a snapshot of the limiter counters"""
+        with self._lock:
+            return {
+                'storage': type(self.buckets).__name__,
+                'rules': self.rules,
+                'allowed': self.allowed,
+                'limited': self.limited,
+                'errors': self.errors
+            }
+
+
+def _request_user_id():
+    """User ID of a valid access token on the current request, if any"""
+    token = get_token_from_header()
+    payload = decode_token(token) if token else None
+    return payload.get('user_id') if payload else None
+
+
+def too_many_requests(blueprint, retry_after):
+    """Build the 429 response in the error format of a blueprint"""
+    message = "Too many requests, please retry later"
+    if blueprint == 'files':
+        response = jsonify({'success': False, 'message': message})
+    else:
+        response = jsonify({"error": message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def init_rate_limiter(app):
+    """Register the rate limiter as a before-request hook of the app"""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return None
+
+    if app.config['RATE_LIMIT_STORAGE'] == 'mongo':
+        buckets = MongoBuckets()
+    else:
+        path = app.config['RATE_LIMIT_PATH'] or os.path.join(app.instance_path, 'ratelimit.bin')
+        buckets = SharedMemoryBuckets(path, app.config['RATE_LIMIT_SLOTS'])
+
+    limiter = RateLimiter(app.config['RATE_LIMITS'], buckets)
+    app.extensions['rate_limiter'] = limiter
+
+    @app.before_request
+    def apply_rate_limit():
+        rule = limiter.rules.get(request.endpoint)
+        if not rule:
+            return None
+
+        view_args = request.view_args or {}
+        download_key = view_args.get('access_token') or view_args.get('file_id')
+        resume = get_resume_claim(download_key) if download_key else None
+        allowed, retry_after = limiter.hit(
+            request.endpoint,
+            request.remote_addr,
+            access_token=download_key,
+            user_id=_request_user_id() if rule.get('key') == 'user' else None,
+            resume_claim=resume[0] if resume else None
+        )
+        if not allowed:
+            return too_many_requests(request.blueprint, retry_after)
+        return None
+
+    return limiter
@@ -0,0 +1,152 @@
+"""
+In-memory revocation list of JWT IDs, synced from MongoDB
+
+Every authenticated request checks its token against this list, so the
+check must not touch the database. A Bloom filter answers "not revoked"
+for almost every token with a few bit lookups; only tokens that hit the
+filter are confirmed against the exact set. A background thread pulls
+revocations made by other processes every REVOCATION_SYNC_SECONDS.
+"""
+import os
+import time
+import hashlib
+import threading
+from datetime import timedelta
+from pymongo.errors import PyMongoError
+from app.models.revoked_token import RevokedToken
+
+# Seconds between pulls of new revocations from other processes
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 5))
+# Each pull re-reads revocations this much older than the newest one seen,
+# catching writes that committed after later ones (de-duplicated by jti)
+REVOCATION_SYNC_OVERLAP = float(os.environ.get('REVOCATION_SYNC_OVERLAP', 30))
+# Seconds between full reloads, which drop expired revocations
+REVOCATION_RELOAD_SECONDS = float(os.environ.get('REVOCATION_RELOAD_SECONDS', 3600))
+# Bloom filter size in bits and number of hash functions
+REVOCATION_BLOOM_BITS = int(os.environ.get('REVOCATION_BLOOM_BITS', 1 << 20))
+REVOCATION_BLOOM_HASHES = 4
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=8 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 8:(i + 1) * 8], 'little') % self.bits
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """
+    Revoked token IDs of this process
+
+    The sync thread is started on first use in each process, so forked
+    workers each run their own.
+    """
+
+    def __init__(self, sync_interval=REVOCATION_SYNC_SECONDS, reload_interval=REVOCATION_RELOAD_SECONDS,
+                 bloom_bits=REVOCATION_BLOOM_BITS, bloom_hashes=REVOCATION_BLOOM_HASHES,
+                 sync_overlap=REVOCATION_SYNC_OVERLAP):
+        self.sync_interval = sync_interval
+        # At least two sync intervals, as a write may straddle a pull
+        self.sync_overlap = timedelta(seconds=max(sync_overlap, 2 * sync_interval))
+        self.reload_interval = reload_interval
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(self.bloom_bits, self.bloom_hashes)
+        self._revoked = {}
+        self._synced_until = None
+        self._reloaded_at = 0.0
+        self._thread = None
+        self._pid = None
+        self.bloom_hits = 0
+        self.sync_failures = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.sync()
+        self._thread = threading.Thread(target=self._run, name='revocation-sync', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self):
+        """Pull new revocations, or reload the whole list when due"""
+        full_reload = time.monotonic() - self._reloaded_at >= self.reload_interval
+        try:
+            records = RevokedToken.get_revoked_since(
+                None if full_reload else self._synced_until,
+                overlap=self.sync_overlap
+            )
+        except PyMongoError:
+            with self._lock:
+                self.sync_failures += 1
+            return
+
+        with self._lock:
+            if full_reload:
+                self._bloom = BloomFilter(self.bloom_bits, self.bloom_hashes)
+                self._revoked = {}
+                self._reloaded_at = time.monotonic()
+            for record in records:
+                self._add(record['_id'], record['expires_at'])
+            if records:
+                self._synced_until = max(self._synced_until or records[-1]['revoked_at'], records[-1]['revoked_at'])
+
+    def _add(self, jti, expires_at):
+        self._bloom.add(jti)
+        self._revoked[jti] = expires_at
+
+    def add(self, jti, expires_at):
+        """Revoke a token in this process right away"""
+        with self._lock:
+            self._add(jti, expires_at)
+
+    def is_revoked(self, jti):
+        """Check a token ID without querying the database"""
+        self._ensure_started()
+        if jti not in self._bloom:
+            return False
+        with self._lock:
+            self.bloom_hits += 1
+            return jti in self._revoked
+
+    def stats(self):
+        """Return a snapshot of the list counters"""
+        with self._lock:
+            return {
+                'revoked': len(self._revoked),
+                'bloom_hits': self.bloom_hits,
+                'sync_failures': self.sync_failures,
+                'sync_interval': self.sync_interval
+            }
+
+
+revocation_list = RevocationList()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=revocation_list._reset)
@@ -0,0 +1,9 @@
+"""
+ASGI entry point for the application.
+
+Run with an ASGI server, for example:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+from app.asgi import create_asgi_app
+
+app = create_asgi_app()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the JSON providers on typical API payloads.
+
+Compares Flask's default provider with FastJSONProvider on a full
+/my-files page and a full admin user list page, and checks that both
+produce the same bytes. No database is needed:
+    python bench_json.py
+"""
+import timeit
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from app.utils.json_provider import FastJSONProvider, orjson
+
+ROUNDS = 2000
+
+
+def my_files_page(size=100):
+    """A page of /api/files/my-files as returned by FileService.get_user_files"""
+    now = datetime.utcnow().replace(microsecond=0)
+    files = [{
+        'file_id': str(ObjectId()),
+        'original_filename': f'quarterly-report-{i}.pdf',
+        'file_size': 1024 * (i + 1),
+        'file_type': 'application/pdf',
+        'upload_date': now - timedelta(hours=i),
+        'expiration_date': now + timedelta(hours=24 - i),
+        'download_count': i,
+        'download_limit': None if i % 2 else 10,
+        'is_active': True,
+        'has_password': bool(i % 3),
+        'access_token': 'x' * 43
+    } for i in range(size)]
+    return {'success': True, 'message': 'Files retrieved successfully',
+            'data': {'files': files, 'count': size, 'next_cursor': 'eyJ2IjoxfQ'}}
+
+
+def users_page(size=100):
+    """A page of /api/users as returned by get_all_users"""
+    now = datetime.utcnow().replace(microsecond=0)
+    users = [{
+        '_id': str(ObjectId()),
+        'username': f'user{i}',
+        'email': f'user{i}@example.com',
+        'first_name': 'Ada',
+        'last_name': 'Lovelace',
+        'created_at': now - timedelta(days=i),
+        'updated_at': now,
+        'is_active': True,
+        'is_admin': i == 0
+    } for i in range(size)]
+    return {'users': users, 'count': size, 'next_cursor': None}
+
+
+def bench(app, provider, payload):
+    """Seconds per response built by a provider"""
+    app.json = provider
+    with app.app_context():
+        seconds = timeit.timeit(lambda: provider.response(payload).get_data(), number=ROUNDS)
+    return seconds / ROUNDS
+
+
+def main():
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    print(f"orjson: {'installed' if orjson else 'not installed, falling back to the stdlib'}")
+
+    for name, payload in [('my-files page', my_files_page()), ('users page', users_page())]:
+        with app.app_context():
+            same = default.response(payload).get_data() == fast.response(payload).get_data()
+        before = bench(app, default, payload)
+        after = bench(app, fast, payload)
+        print(f"{name:14} default {before * 1e6:8.1f} us   fast {after * 1e6:8.1f} us   "
+              f"{before / after:4.1f}x   identical output: {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,10 @@ Main entry point for the application.
 import os
 from app import create_app
 
-app = create_app()
+# Password hashing processes are spawned, and import this module again as
+# __mp_main__ when it is run directly; they must not create an app of their own
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,14 @@
+"""
+Sidecar entry point that only runs the maintenance scheduler.
+
+Use it when the web workers run with SCHEDULER_ENABLED=false:
+    python scheduler.py
+"""
+import os
+from app import create_app
+
+if __name__ == '__main__':
+    # The scheduler runs in the foreground here, not in a background thread
+    os.environ['SCHEDULER_ENABLED'] = 'false'
+    app = create_app()
+    app.extensions['scheduler'].run_forever()
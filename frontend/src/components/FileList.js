@@ -10,11 +10,14 @@ const FileList = () => {
     const [showShareModal, setShowShareModal] = useState(false);
     const [selectedFile, setSelectedFile] = useState(null);
     const [includeExpired, setIncludeExpired] = useState(false);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         fetchFiles();
     }, [includeExpired]);
 
+    // Load the first page again, further pages are loaded on demand
     const fetchFiles = async () => {
         try {
             setLoading(true);
@@ -22,6 +25,7 @@ const FileList = () => {
             const response = await fileAPI.getMyFiles(includeExpired);
             if (response.data.success) {
                 setFiles(response.data.data);
+                setNextCursor(response.data.next_cursor);
             } else {
                 setError(response.data.message);
             }
@@ -32,6 +36,24 @@ const FileList = () => {
         }
     };
 
+    const loadMoreFiles = async () => {
+        try {
+            setLoadingMore(true);
+            setError(null);
+            const response = await fileAPI.getMyFiles(includeExpired, nextCursor);
+            if (response.data.success) {
+                setFiles((previous) => [...previous, ...response.data.data]);
+                setNextCursor(response.data.next_cursor);
+            } else {
+                setError(response.data.message);
+            }
+        } catch (error) {
+            setError(error.response?.data?.message || 'Failed to fetch files');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleDownload = async (fileId, filename) => {
         try {
             const response = await fileAPI.downloadFile(fileId);
@@ -241,6 +263,18 @@ const FileList = () => {
                                     ))}
                                 </tbody>
                             </Table>
+                            {nextCursor && (
+                                <div className="text-center p-3">
+                                    <Button variant="outline-secondary" size="sm" onClick={loadMoreFiles} disabled={loadingMore}>
+                                        {loadingMore ? (
+                                            <Spinner animation="border" size="sm" className="me-1" />
+                                        ) : (
+                                            <i className="fas fa-chevron-down me-1"></i>
+                                        )}
+                                        Load more
+                                    </Button>
+                                </div>
+                            )}
                         </div>
                     )}
                 </Card.Body>
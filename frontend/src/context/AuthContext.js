@@ -30,6 +30,7 @@ export const AuthProvider = ({ children }) => {
             }
         } catch (error) {
             localStorage.removeItem('token');
+            localStorage.removeItem('refreshToken');
             setUser(null);
         } finally {
             setLoading(false);
@@ -47,6 +48,7 @@ export const AuthProvider = ({ children }) => {
             const { user, tokens } = response.data;
 
             localStorage.setItem('token', tokens.access_token);
+            localStorage.setItem('refreshToken', tokens.refresh_token);
             setUser(user);
             return { success: true };
         } catch (error) {
@@ -70,6 +72,7 @@ export const AuthProvider = ({ children }) => {
             const { user, tokens } = response.data;
 
             localStorage.setItem('token', tokens.access_token);
+            localStorage.setItem('refreshToken', tokens.refresh_token);
             setUser(user);
             return { success: true };
         } catch (error) {
@@ -82,7 +85,14 @@ export const AuthProvider = ({ children }) => {
     };
 
     const logout = () => {
+        // Revoke the session on the server, the local logout doesn't wait for it
+        if (localStorage.getItem('token')) {
+            api.post('/logout', {
+                refresh_token: localStorage.getItem('refreshToken')
+            }).catch(() => {});
+        }
         localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
         setUser(null);
         setError(null);
     };
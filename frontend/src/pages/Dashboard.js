@@ -22,19 +22,19 @@ const Dashboard = () => {
 
     const fetchDashboardStats = async () => {
         try {
-            // Fetch files to calculate stats
-            const response = await fileAPI.getMyFiles(false);
-            if (response.data.success) {
-                const files = response.data.data;
-                const totalFiles = files.length;
-                const totalShares = files.reduce((sum, file) => sum + (file.download_count || 0), 0);
-                const storageUsed = files.reduce((sum, file) => sum + (file.size || 0), 0);
+            // Totals are computed by the server, only the 3 most recent files are fetched
+            const [statsResponse, filesResponse] = await Promise.all([
+                fileAPI.getMyFileStats(),
+                fileAPI.getMyFiles(false, null, 3)
+            ]);
+            if (statsResponse.data.success && filesResponse.data.success) {
+                const totals = statsResponse.data.data;
 
                 setStats({
-                    totalFiles,
-                    totalShares,
-                    storageUsed,
-                    recentActivity: files.slice(0, 3) // Get 3 most recent files
+                    totalFiles: totals.total_files,
+                    totalShares: totals.total_downloads,
+                    storageUsed: totals.storage_used,
+                    recentActivity: filesResponse.data.data
                 });
             }
         } catch (error) {
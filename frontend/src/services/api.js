@@ -32,6 +32,7 @@ api.interceptors.response.use(
         if (error.response?.status === 401) {
             // Token expired or invalid
             localStorage.removeItem('token');
+            localStorage.removeItem('refreshToken');
             window.location.href = '/login';
         }
         return Promise.reject(error);
@@ -40,10 +41,62 @@ api.interceptors.response.use(
 
 export default api;
 
+// Files above this size are sent through a resumable upload session
+const RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024; // 8MB
+const UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024; // 5MB
+const UPLOAD_CHUNK_RETRIES = 5;
+
+// Upload a file in chunks, resuming from the server's offset after a failure
+const uploadFileResumable = async (file, options = {}) => {
+    const session = await api.post('/files/uploads', {
+        filename: file.name,
+        file_size: file.size,
+        expiration_hours: options.expirationHours,
+        password: options.password,
+        download_limit: options.downloadLimit,
+    });
+    const uploadId = session.data.data.upload_id;
+    let offset = session.data.data.offset;
+    let failures = 0;
+
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + UPLOAD_CHUNK_SIZE);
+        try {
+            const response = await api.patch(`/files/uploads/${uploadId}`, chunk, {
+                headers: {
+                    'Content-Type': 'application/offset+octet-stream',
+                    'Upload-Offset': offset,
+                },
+                timeout: 0,
+            });
+            offset = response.data.data.offset;
+            failures = 0;
+        } catch (error) {
+            failures += 1;
+            if (failures > UPLOAD_CHUNK_RETRIES || error.response?.status === 404) {
+                throw error;
+            }
+            // Ask the server how much it actually stored before retrying
+            const status = await api.get(`/files/uploads/${uploadId}`);
+            offset = status.data.data.offset;
+        }
+
+        if (options.onProgress) {
+            options.onProgress({ loaded: offset, total: file.size });
+        }
+    }
+
+    return api.post(`/files/uploads/${uploadId}/complete`);
+};
+
 // File API methods
 export const fileAPI = {
     // Upload a file
     uploadFile: async (file, options = {}) => {
+        if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+            return uploadFileResumable(file, options);
+        }
+
         const formData = new FormData();
         formData.append('file', file);
 
@@ -65,9 +118,18 @@ export const fileAPI = {
         });
     },
 
-    // Get user's files
-    getMyFiles: async (includeExpired = false) => {
-        return api.get(`/files/my-files?include_expired=${includeExpired}`);
+    // Get a page of the user's files, pass the next_cursor of the previous page for the next one
+    getMyFiles: async (includeExpired = false, cursor = null, limit = 50) => {
+        const params = { include_expired: includeExpired, limit };
+        if (cursor) {
+            params.cursor = cursor;
+        }
+        return api.get('/files/my-files', { params });
+    },
+
+    // Get the number, downloads and total size of the user's active files
+    getMyFileStats: async () => {
+        return api.get('/files/my-files/stats');
     },
 
     // Get file info